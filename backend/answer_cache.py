@@ -0,0 +1,202 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Words that point back into the conversation ("explain that", "what about them?")
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him",
+    "her", "his", "above", "previous", "earlier", "before", "again", "more", "else", "also",
+    "same", "former", "latter", "elaborate", "continue", "why",
+}
+
+
+def context_key(results):
+    """
+    Key of the context retrieved for a question: the (fileid, chunk index, chunk text)
+    triples in rank order. Re-indexed or replaced files retrieve different chunks or text,
+    so their old answers stop matching without explicit invalidation.
+    """
+    sha = hashlib.sha256()
+    for fileid, chunk_idx, text in results:
+        sha.update(f"{fileid}\0{chunk_idx}\0".encode("utf-8"))
+        sha.update(text.encode("utf-8"))
+        sha.update(b"\1")
+    return sha.hexdigest()
+
+
+def depends_on_history(question):
+    """
+    Whether a question asked mid-conversation may refer to earlier turns, so its answer
+    depends on the chat history and must neither come from nor go into the cache. Errs on
+    the side of skipping the cache: very short questions and any back-reference count.
+    """
+    words = re.findall(r"[a-z']+", question.lower())
+    return len(words) <= 3 or not FOLLOW_UP_WORDS.isdisjoint(words)
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype="float32").reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Answer:
+    def __init__(self, bucket, question, vector, answer, created=None):
+        self.bucket = bucket
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.created = created or time.time()
+
+
+class AnswerLookup:
+    """Result of AnswerCache.lookup: answer is the cached text or None; store() caches a new one."""
+
+    def __init__(self, cache, bucket, question, vector, answer=None, similarity=None):
+        self.cache = cache
+        self.bucket = bucket
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.similarity = similarity
+
+    def store(self, answer):
+        if answer and self.answer is None and self.cache is not None:
+            self.cache.put(self.bucket, self.question, self.vector, answer)
+
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers for repeated and near-duplicate questions.
+
+    Answers are grouped by (uid, context key), so a cached answer is only ever reused for a
+    question that retrieved exactly the same chunks. Within a group, a new question matches a
+    cached one when the cosine similarity of their embeddings is at least threshold. Entries
+    expire ttl seconds after they were stored and the least recently used are evicted beyond
+    max_entries; max_entries=0 disables the cache.
+
+    The entries live in this process. With a shared store (SharedState), answers are also
+    written there and a local miss is looked up in it, so the uvicorn workers on a host
+    share their answers instead of each paying for its own.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400, threshold=0.92, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self.threshold = threshold
+        self.shared = shared
+        self.entries = OrderedDict()
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+
+    def skip(self, uid, context, question, query_embedding):
+        """A lookup that neither returns nor stores an answer, for history-dependent questions."""
+        with self.lock:
+            self.skipped += 1
+        return AnswerLookup(None, (uid, context), question, _normalize(query_embedding))
+
+    def lookup(self, uid, context, question, query_embedding):
+        bucket = (uid, context)
+        vector = _normalize(query_embedding)
+        if not self.max_entries:
+            return AnswerLookup(self, bucket, question, vector)
+        with self.lock:
+            ids = self._live_ids(bucket)
+            if ids:
+                similarities = np.stack([self.entries[i].vector for i in ids]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    self.entries.move_to_end(ids[best])
+                    entry = self.entries[ids[best]]
+                    return AnswerLookup(self, bucket, question, vector, entry.answer, float(similarities[best]))
+        if self.shared is not None:
+            found = self._lookup_shared(bucket, question, vector)
+            if found is not None:
+                return found
+        with self.lock:
+            self.misses += 1
+        return AnswerLookup(self, bucket, question, vector)
+
+    def _lookup_shared(self, bucket, question, vector):
+        rows = self.shared.get_answers(*bucket, since=time.time() - self.ttl if self.ttl else 0)
+        if not rows:
+            return None
+        similarities = np.stack([np.frombuffer(row[1], dtype="float32") for row in rows]) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        cached_question, cached_vector, answer, created = rows[best]
+        with self.lock:
+            self.hits += 1
+            self._insert(bucket, cached_question, np.frombuffer(cached_vector, dtype="float32"), answer, created)
+        return AnswerLookup(self, bucket, question, vector, answer, float(similarities[best]))
+
+    def put(self, bucket, question, vector, answer):
+        if not self.max_entries:
+            return
+        with self.lock:
+            self._insert(bucket, question, vector, answer)
+        if self.shared is not None:
+            self.shared.put_answer(*bucket, question, np.asarray(vector, dtype="float32").tobytes(), answer)
+
+    def _insert(self, bucket, question, vector, answer, created=None):
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = _Answer(bucket, question, vector, answer, created)
+        self.buckets.setdefault(bucket, []).append(entry_id)
+        while len(self.entries) > self.max_entries:
+            evicted_id, evicted = self.entries.popitem(last=False)
+            ids = self.buckets[evicted.bucket]
+            ids.remove(evicted_id)
+            if not ids:
+                del self.buckets[evicted.bucket]
+            self.evictions += 1
+
+    def invalidate_user(self, uid):
+        """Drop every answer cached for the user, e.g. when their files are deleted."""
+        with self.lock:
+            for bucket in [b for b in self.buckets if b[0] == uid]:
+                for entry_id in self.buckets.pop(bucket):
+                    self.entries.pop(entry_id, None)
+        if self.shared is not None:
+            self.shared.drop_answers(uid)
+
+    def _live_ids(self, bucket):
+        ids = self.buckets.get(bucket)
+        if not ids:
+            return []
+        if self.ttl:
+            cutoff = time.time() - self.ttl
+            for entry_id in [i for i in ids if self.entries[i].created < cutoff]:
+                del self.entries[entry_id]
+                ids.remove(entry_id)
+            if not ids:
+                del self.buckets[bucket]
+        return list(ids)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "contexts": len(self.buckets),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
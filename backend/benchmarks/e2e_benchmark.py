@@ -0,0 +1,422 @@
+"""
+End-to-end benchmark of the API running fully offline.
+
+Starts the mock LLM (benchmarks/mock_llm.py) and the app with QUERYFILE_BACKEND=local, so
+blobs go to a temporary directory, metadata to an in-memory store and OCR/LLM calls to local
+stand-ins, then runs scripted workloads against it over HTTP:
+
+    upload   bulk upload of generated PDF/DOCX/XLSX files, polling /jobs until each finishes
+    query    concurrent /query and /query/stream requests (time to first token for streams)
+    churn    /load_index switching between files, to exercise the index cache
+
+    python benchmarks/e2e_benchmark.py --files 12 --queries 200 --concurrency 16 --output run.json
+    python benchmarks/e2e_benchmark.py --output new.json --compare run.json
+
+Results carry throughput and p50/p95/p99 per endpoint and per ingestion stage, plus the git
+commit and configuration, so runs on different commits can be compared.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "revenue margin forecast contract clause liability payment schedule invoice delivery "
+    "warranty termination renewal quarter budget audit compliance policy employee benefit "
+    "pension insurance claim premium coverage deductible supplier customer order shipment"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# Corpus generation
+# ---------------------------------------------------------------------------
+
+def sentence(rng, n=14):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def make_pdf(path, pages, rng):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), " ".join(sentence(rng) for _ in range(30)), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def make_docx(path, paragraphs, rng):
+    from docx import Document
+
+    doc = Document()
+    for _ in range(paragraphs):
+        doc.add_paragraph(" ".join(sentence(rng) for _ in range(4)))
+    doc.save(path)
+
+
+def make_xlsx(path, rows, rng):
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["id", "customer", "item", "amount", "note"])
+    for i in range(rows):
+        ws.append([i, rng.choice(WORDS), rng.choice(WORDS), round(rng.uniform(1, 10000), 2), sentence(rng, 8)])
+    wb.save(path)
+
+
+def generate_corpus(directory, count, pages, seed=0):
+    """Write count files cycling through PDF, DOCX and XLSX; returns their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        kind = ("pdf", "docx", "xlsx")[i % 3]
+        path = os.path.join(directory, f"doc{i:03d}.{kind}")
+        if kind == "pdf":
+            make_pdf(path, pages, rng)
+        elif kind == "docx":
+            make_docx(path, pages * 8, rng)
+        else:
+            make_xlsx(path, pages * 40, rng)
+        paths.append(path)
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Processes
+# ---------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args, env, log_path):
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_up(client, url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name, message):
+        self.errors.setdefault(name, []).append(message)
+
+    def summary(self, wall_seconds):
+        result = {}
+        for name, values in sorted(self.samples.items()):
+            arr = np.array(values)
+            result[name] = {
+                "count": len(values),
+                "errors": len(self.errors.get(name, [])),
+                "throughput_per_s": round(len(values) / wall_seconds, 3) if wall_seconds else None,
+                "mean_ms": round(float(arr.mean()) * 1000, 2),
+                "p50_ms": round(float(np.percentile(arr, 50)) * 1000, 2),
+                "p95_ms": round(float(np.percentile(arr, 95)) * 1000, 2),
+                "p99_ms": round(float(np.percentile(arr, 99)) * 1000, 2),
+            }
+        for name, messages in self.errors.items():
+            result.setdefault(name, {"count": 0, "errors": len(messages)})
+            result[name]["sample_error"] = messages[0]
+        return result
+
+
+async def timed(recorder, name, coro):
+    t = time.perf_counter()
+    try:
+        response = await coro
+        response.raise_for_status()
+    except Exception as e:
+        recorder.error(name, str(e))
+        return None
+    recorder.add(name, time.perf_counter() - t)
+    return response
+
+
+async def run_bounded(concurrency, coros):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+# ---------------------------------------------------------------------------
+# Workloads
+# ---------------------------------------------------------------------------
+
+async def upload_workload(client, paths, uid, concurrency, poll_interval):
+    """Upload every file, wait for its job and record upload latency, job time and stage times."""
+    recorder = Recorder()
+    fileids = []
+
+    async def upload(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        response = await timed(recorder, "POST /upload_pdf", client.post(
+            "/upload_pdf", data={"uid": uid}, files={"file": (os.path.basename(path), data)}
+        ))
+        if response is None:
+            return
+        job_id = response.json()["job_id"]
+        started = time.perf_counter()
+        while True:
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in ("done", "failed", "partial"):
+                break
+            await asyncio.sleep(poll_interval)
+        recorder.add("ingest job", time.perf_counter() - started)
+        for item in job["items"]:
+            if item["status"] != "done":
+                recorder.error("ingest job", str(item["error"]))
+                continue
+            fileids.append(item["result"]["id"])
+            for stage, entry in item["stages"].items():
+                if entry.get("seconds") is not None:
+                    recorder.add(f"stage {stage}", entry["seconds"])
+
+    t = time.perf_counter()
+    await run_bounded(concurrency, [upload(p) for p in paths])
+    wall = time.perf_counter() - t
+    return fileids, {"wall_seconds": round(wall, 3), "files": len(paths), "metrics": recorder.summary(wall)}
+
+
+async def query_workload(client, uid, fileids, count, concurrency, stream_fraction, seed=0):
+    """Concurrent single-file and whole-collection queries, a share of them streamed."""
+    recorder = Recorder()
+    rng = random.Random(seed)
+
+    async def plain(form):
+        await timed(recorder, "POST /query", client.post("/query", data=form))
+
+    async def streamed(form):
+        t = time.perf_counter()
+        first = None
+        try:
+            async with client.stream("POST", "/query/stream", data=form) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if "error" in event:
+                        raise RuntimeError(event["error"])
+                    if first is None and "token" in event:
+                        first = time.perf_counter() - t
+        except Exception as e:
+            recorder.error("POST /query/stream", str(e))
+            return
+        recorder.add("POST /query/stream", time.perf_counter() - t)
+        if first is not None:
+            recorder.add("POST /query/stream ttft", first)
+
+    coros = []
+    for _ in range(count):
+        form = {"uid": uid, "query": f"What does the document say about {rng.choice(WORDS)} and {rng.choice(WORDS)}?"}
+        if rng.random() < 0.2:
+            form["fileids"] = "all"
+        else:
+            form["fileid"] = rng.choice(fileids)
+        coros.append(streamed(form) if rng.random() < stream_fraction else plain(form))
+
+    t = time.perf_counter()
+    await run_bounded(concurrency, coros)
+    wall = time.perf_counter() - t
+    return {"wall_seconds": round(wall, 3), "requests": count, "metrics": recorder.summary(wall)}
+
+
+async def churn_workload(client, uid, fileids, count, concurrency, seed=0):
+    """Switch the active file back and forth, as users do when browsing their documents."""
+    recorder = Recorder()
+    rng = random.Random(seed)
+    coros = [
+        timed(recorder, "POST /load_index", client.post("/load_index", data={"uid": uid, "fileid": rng.choice(fileids)}))
+        for _ in range(count)
+    ]
+    t = time.perf_counter()
+    await run_bounded(concurrency, coros)
+    wall = time.perf_counter() - t
+    cache = (await client.get("/cache/stats")).json()
+    return {"wall_seconds": round(wall, 3), "requests": count, "metrics": recorder.summary(wall), "cache": cache}
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+async def run(args, workdir):
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir)
+    paths = generate_corpus(corpus_dir, args.files, args.pages)
+    print(f"Generated {len(paths)} files in {corpus_dir}")
+
+    llm_port, app_port = free_port(), free_port()
+    env = dict(os.environ)
+    env.update({
+        "QUERYFILE_BACKEND": "local",
+        "LOCAL_DATA_DIR": os.path.join(workdir, "data"),
+        "LOCAL_OCR_SECONDS_PER_PAGE": str(args.ocr_seconds_per_page),
+        "DEEPSEEK_API_URL": f"http://127.0.0.1:{llm_port}/v1/chat/completions",
+        "DEEPSEEK_API_KEY": "benchmark",
+        "CHUNK_STORE_DIR": os.path.join(workdir, "chunks"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+    })
+    llm = start_process([
+        sys.executable, "benchmarks/mock_llm.py", "--port", str(llm_port),
+        "--first-token-ms", str(args.llm_first_token_ms), "--tokens", str(args.llm_tokens),
+        "--token-interval-ms", str(args.llm_token_interval_ms),
+    ], env, os.path.join(workdir, "mock_llm.log"))
+    app = start_process([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning",
+    ], env, os.path.join(workdir, "app.log"))
+
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=600) as client:
+            await wait_until_up(client, f"http://127.0.0.1:{llm_port}/docs", llm, args.startup_timeout)
+            await wait_until_up(client, "/ready", app, args.startup_timeout)
+            uid = f"bench-{int(time.time())}"
+
+            results = {}
+            fileids, results["upload"] = await upload_workload(client, paths, uid, args.concurrency, args.poll_interval)
+            if not fileids:
+                raise RuntimeError(f"No file was ingested; see {os.path.join(workdir, 'app.log')}")
+            if "query" in args.workloads:
+                results["query"] = await query_workload(
+                    client, uid, fileids, args.queries, args.concurrency, args.stream_fraction
+                )
+            if "churn" in args.workloads:
+                results["churn"] = await churn_workload(client, uid, fileids, args.churn, args.concurrency)
+            return results
+    finally:
+        for process in (app, llm):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def compare(results, baseline):
+    """Print p50/p95 changes against a baseline run, metric by metric."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for workload, data in results["workloads"].items():
+        base_metrics = baseline.get("workloads", {}).get(workload, {}).get("metrics", {})
+        for name, metric in data["metrics"].items():
+            base = base_metrics.get(name)
+            if not base or "p50_ms" not in base or "p50_ms" not in metric:
+                continue
+            changes = "  ".join(
+                f"{key} {base[key]:.1f} -> {metric[key]:.1f} ms ({(metric[key] - base[key]) / base[key] * 100:+.1f}%)"
+                for key in ("p50_ms", "p95_ms") if base[key]
+            )
+            print(f"  {workload:7s} {name:28s} {changes}")
+
+
+def print_report(results):
+    for workload, data in results["workloads"].items():
+        print(f"\n{workload} ({data['wall_seconds']}s)")
+        for name, m in data["metrics"].items():
+            if "p50_ms" not in m:
+                print(f"  {name:30s} {m['errors']} errors, e.g. {m.get('sample_error')}")
+                continue
+            print(
+                f"  {name:30s} n={m['count']:<5d} err={m['errors']:<3d} {m['throughput_per_s']:8.2f}/s  "
+                f"p50 {m['p50_ms']:9.1f}  p95 {m['p95_ms']:9.1f}  p99 {m['p99_ms']:9.1f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12, help="Number of generated files to upload")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per PDF (DOCX/XLSX are sized to match)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--churn", type=int, default=200, help="Number of /load_index switches")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream-fraction", type=float, default=0.5, help="Share of queries sent to /query/stream")
+    parser.add_argument("--workloads", nargs="+", default=["query", "churn"], choices=["query", "churn"],
+                        help="Workloads to run after the upload, which always runs")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens", type=int, default=120)
+    parser.add_argument("--llm-token-interval-ms", type=float, default=15)
+    parser.add_argument("--ocr-seconds-per-page", type=float, default=0.0)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory (corpus, logs, data)")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="queryfile_bench_")
+    try:
+        workloads = asyncio.run(run(args, workdir))
+    finally:
+        if args.keep:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep")},
+        "workloads": workloads,
+    }
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
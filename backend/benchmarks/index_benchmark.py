@@ -0,0 +1,121 @@
+"""
+Recall / latency / size benchmark for the index types chosen by index_factory.
+
+Compares every candidate index against the exact flat baseline on the same vectors:
+
+    python benchmarks/index_benchmark.py --sizes 5000 50000 200000
+    python benchmarks/index_benchmark.py --vectors embeddings.npy --output results.json
+
+Without --vectors, normalized vectors are drawn from a Gaussian mixture, which is closer to
+sentence embeddings than uniform noise.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_factory import IVF_ID_BYTES, build_index, choose_index_spec  # noqa: E402
+
+
+def synthetic_vectors(n, dimension, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype("float32")
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def candidate_specs(n, dimension, recall_target):
+    """The factory's own choice plus every non-flat type it can pick, sized for n vectors."""
+    specs = {"auto": choose_index_spec(n, dimension, recall_target=recall_target)}
+    specs["hnsw"] = choose_index_spec(n, dimension, recall_target=recall_target, flat_max_vectors=0)
+    specs["ivfflat"] = choose_index_spec(n, dimension, recall_target=recall_target, removable=True, flat_max_vectors=0)
+    for budget in (dimension + IVF_ID_BYTES, 64):
+        spec = choose_index_spec(n, dimension, memory_bytes_per_vector=budget, recall_target=recall_target, flat_max_vectors=0)
+        specs[f"{spec['type']}@{budget}"] = spec
+    # What a small budget gets without the recall fallback
+    specs["ivfpq@64"] = choose_index_spec(n, dimension, memory_bytes_per_vector=64, recall_target=0, flat_max_vectors=0)
+    return specs
+
+
+def measure(index, queries, k):
+    latencies = []
+    results = []
+    for q in queries:
+        t = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - t)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def run(vectors, n_queries, k, recall_target):
+    n, dimension = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.standard_normal((n_queries, dimension)).astype("float32")
+
+    flat = faiss.IndexFlatL2(dimension)
+    flat.add(vectors)
+    truth, flat_latency = measure(flat, queries, k)
+
+    rows = [{
+        "n": n, "index": "flat", "spec": {"type": "flat", "params": {}}, "build_s": 0.0,
+        "recall_at_k": 1.0, "p50_ms": float(np.percentile(flat_latency, 50) * 1000),
+        "p95_ms": float(np.percentile(flat_latency, 95) * 1000),
+        "bytes_per_vector": len(faiss.serialize_index(flat)) / n,
+    }]
+    for name, spec in candidate_specs(n, dimension, recall_target).items():
+        if spec["type"] == "flat":
+            continue
+        t = time.perf_counter()
+        index = build_index(vectors, spec)
+        build_s = time.perf_counter() - t
+        found, latency = measure(index, queries, k)
+        rows.append({
+            "n": n, "index": name, "spec": spec, "build_s": round(build_s, 3),
+            "recall_at_k": round(recall_at_k(found, truth), 4),
+            "p50_ms": float(np.percentile(latency, 50) * 1000),
+            "p95_ms": float(np.percentile(latency, 95) * 1000),
+            "bytes_per_vector": len(faiss.serialize_index(index)) / n,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--vectors", help=".npy file of real embeddings; --sizes take prefixes of it")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--recall-target", type=float, default=0.95)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    source = np.load(args.vectors).astype("float32") if args.vectors else None
+    rows = []
+    for n in args.sizes:
+        vectors = source[:n] if source is not None else synthetic_vectors(n, args.dimension)
+        rows.extend(run(np.ascontiguousarray(vectors), min(args.queries, len(vectors)), args.k, args.recall_target))
+
+    print(f"{'n':>8} {'index':>10} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'bytes/vec':>10} {'build s':>8}")
+    for row in rows:
+        print(f"{row['n']:>8} {row['index']:>10} {row['recall_at_k']:>9.3f} {row['p50_ms']:>8.3f} "
+              f"{row['p95_ms']:>8.3f} {row['bytes_per_vector']:>10.1f} {row['build_s']:>8.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Minimal OpenAI/DeepSeek-compatible chat completions server for offline benchmarks.
+
+    python benchmarks/mock_llm.py --port 8900 --first-token-ms 300 --tokens 120 --token-interval-ms 15
+
+Point the app at it with DEEPSEEK_API_URL=http://127.0.0.1:8900/v1/chat/completions. Both
+plain and "stream": true requests are answered; streamed responses use the same SSE framing
+("data: {...}" lines ending with "data: [DONE]") as the real API. The first --fail-requests
+requests are answered with --fail-status instead, to exercise client retries.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(first_token_ms=300, tokens=120, token_interval_ms=15, fail_requests=0, fail_status=503):
+    app = FastAPI()
+    app.state.requests = 0
+    words = [f"token{i} " for i in range(tokens)]
+
+    def chunk(content=None, finish_reason=None):
+        delta = {"content": content} if content is not None else {}
+        return {
+            "id": "mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "mock",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if app.state.requests <= fail_requests:
+            return JSONResponse({"error": {"message": "mock failure"}}, status_code=fail_status)
+        await asyncio.sleep(first_token_ms / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_interval_ms * max(tokens - 1, 0) / 1000)
+            return {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "mock",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+            }
+
+        async def events():
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(token_interval_ms / 1000)
+                yield f"data: {json.dumps(chunk(word))}\n\n"
+            yield f"data: {json.dumps(chunk(finish_reason='stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--token-interval-ms", type=float, default=15)
+    parser.add_argument("--fail-requests", type=int, default=0)
+    parser.add_argument("--fail-status", type=int, default=503)
+    args = parser.parse_args()
+    app = create_app(args.first_token_ms, args.tokens, args.token_interval_ms, args.fail_requests, args.fail_status)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Compact binary chunk store.
+
+Layout (little-endian):
+    header   MAGIC(8) version(u16) flags(u16) reserved(u32) count(u64) offsets_pos(u64)
+    blob     all chunks as one UTF-8 byte string, zero-padded to a multiple of 8
+    offsets  (count + 1) x u64 byte offsets of each chunk inside the blob
+    pages    count x i32 page numbers (only if FLAG_PAGES is set)
+
+The blob comes first so a writer can stream chunks to disk without knowing their
+count up front; the header is patched on close. Readers mmap the file and slice
+chunks out of it without copying the rest of the document into memory.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+MAGIC = b"QFCHUNK\x00"
+VERSION = 1
+FLAG_PAGES = 1
+HEADER = struct.Struct("<8sHHIQQ")
+
+
+class ChunkStoreWriter:
+    """Append chunks one at a time and write them out as a chunk store file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(b"\x00" * HEADER.size)
+        self.offsets = array("Q", [0])
+        self.pages = array("i")
+        self.has_pages = False
+
+    def add(self, text, page=None):
+        data = text.encode("utf-8")
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        if page is not None:
+            self.has_pages = True
+        self.pages.append(-1 if page is None else page)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def close(self):
+        # Pad so the offsets table is 8-byte aligned inside the mapping
+        padding = -(HEADER.size + self.offsets[-1]) % 8
+        self.file.write(b"\x00" * padding)
+        offsets_pos = HEADER.size + self.offsets[-1] + padding
+        self.file.write(np.frombuffer(self.offsets, dtype="<u8").tobytes())
+        flags = 0
+        if self.has_pages:
+            flags |= FLAG_PAGES
+            self.file.write(np.frombuffer(self.pages, dtype="<i4").tobytes())
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, flags, 0, len(self), offsets_pos))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+
+def write_chunk_store(path, chunks, pages=None):
+    with ChunkStoreWriter(path) as writer:
+        for i, chunk in enumerate(chunks):
+            writer.add(chunk, None if pages is None else pages[i])
+
+
+class ChunkStore:
+    """
+    Read-only sequence of chunks backed by a chunk store buffer (bytes or mmap).
+    Indexing decodes only the requested chunk.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        if len(buffer) < HEADER.size:
+            raise ValueError("Not a chunk store file")
+        magic, version, flags, _, count, offsets_pos = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a chunk store file")
+        if version > VERSION:
+            raise ValueError(f"Unsupported chunk store version {version}")
+        end = offsets_pos + 8 * (count + 1) + (4 * count if flags & FLAG_PAGES else 0)
+        if offsets_pos < HEADER.size or end > len(buffer):
+            raise ValueError("Chunk store file is truncated")
+        self.version = version
+        self.count = count
+        self.view = memoryview(buffer)
+        self.offsets = np.frombuffer(buffer, dtype="<u8", count=count + 1, offset=offsets_pos)
+        if HEADER.size + int(self.offsets[-1]) > offsets_pos or np.any(self.offsets[1:] < self.offsets[:-1]):
+            raise ValueError("Chunk store offsets are corrupt")
+        self.pages = None
+        if flags & FLAG_PAGES:
+            self.pages = np.frombuffer(buffer, dtype="<i4", count=count, offset=offsets_pos + 8 * (count + 1))
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError("chunk index out of range")
+        start = HEADER.size + int(self.offsets[idx])
+        end = HEADER.size + int(self.offsets[idx + 1])
+        return str(self.view[start:end], "utf-8")
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def page(self, idx):
+        if self.pages is None or self.pages[idx] < 0:
+            return None
+        return int(self.pages[idx])
+
+    @property
+    def nbytes(self):
+        # The blob is paged in from the mapping on demand; only the offset tables are touched up front
+        return self.offsets.nbytes + (self.pages.nbytes if self.pages is not None else 0)
+
+
+def is_chunk_store(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def convert_json_chunks(json_path, out_path):
+    """Migrate a legacy .chunks.json artifact to the binary chunk store format."""
+    with open(json_path, "r") as f:
+        chunks = json.load(f)
+    write_chunk_store(out_path, chunks)
+    return len(chunks)
+
+
+def load_chunks(path):
+    """Open a chunk artifact of either format: binary stores are mmapped, legacy JSON is parsed."""
+    if is_chunk_store(path):
+        return ChunkStore.open(path)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    # python chunk_store.py <in.chunks.json> <out.chunks.bin>
+    if len(sys.argv) != 3:
+        print("usage: python chunk_store.py <in.chunks.json> <out.chunks.bin>")
+        sys.exit(1)
+    count = convert_json_chunks(sys.argv[1], sys.argv[2])
+    print(f"Converted {count} chunks to {sys.argv[2]} ({os.path.getsize(sys.argv[2])} bytes)")
@@ -0,0 +1,147 @@
+import threading
+
+import faiss
+import numpy as np
+
+from index_cache import chunks_nbytes
+from index_factory import code_bytes, create_index, search_params
+
+# Vector ids in a collection are (file slot << CHUNK_BITS) | chunk index
+CHUNK_BITS = 32
+
+
+def index_vectors(index):
+    """Return all vectors stored in a per-file index as a float32 array (approximate for PQ)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+class CollectionIndex:
+    """
+    One FAISS index over all of a user's files.
+
+    Every vector id encodes the file slot and the chunk position inside that file, so one
+    search returns (fileid, chunk) pairs across documents. Files are added and removed
+    incrementally; a search can be restricted to a subset of files with an id selector.
+    Small collections use an exact flat index; large ones use an IVF index from the index
+    factory (trained on the vectors available when the collection is built), which takes
+    ids and supports removal natively.
+
+    A collection can be written out and restored over a read-only mapped copy of the index
+    (see IndexRegistry.open_index); a mapped collection only serves searches.
+    """
+
+    def __init__(self, dimension, spec=None, training_vectors=None):
+        self.dimension = dimension
+        self.spec = spec or {"type": "flat", "params": {}}
+        if self.spec["type"] == "flat":
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        else:
+            self.index = create_index(dimension, self.spec, training_vectors)
+        self.slots = {}
+        self.fileids = {}
+        self.chunks = {}
+        self.next_slot = 0
+        self.mapped = False
+        self.lock = threading.Lock()
+
+    @classmethod
+    def restore(cls, index, spec, state, chunks, mapped=True):
+        """
+        Rebuild a collection around an index written by write(). state is what write()
+        returned and chunks maps every fileid in it to that file's chunks.
+        """
+        collection = cls.__new__(cls)
+        collection.dimension = index.d
+        collection.spec = spec or {"type": "flat", "params": {}}
+        collection.index = index
+        collection.slots = dict(state["slots"])
+        collection.fileids = {slot: fileid for fileid, slot in collection.slots.items()}
+        collection.chunks = {fileid: chunks[fileid] for fileid in collection.slots}
+        collection.next_slot = state["next_slot"]
+        collection.mapped = mapped
+        collection.lock = threading.Lock()
+        return collection
+
+    def write(self, path):
+        """Write the index to path and return the state restore() needs besides the chunks."""
+        with self.lock:
+            faiss.write_index(self.index, path)
+            return {"slots": dict(self.slots), "next_slot": self.next_slot}
+
+    def __contains__(self, fileid):
+        return fileid in self.slots
+
+    def add_file(self, fileid, vectors, chunks):
+        self._check_writable()
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self.lock:
+            if fileid in self.slots:
+                self._remove(fileid)
+            slot = self.next_slot
+            self.next_slot += 1
+            ids = (np.int64(slot) << CHUNK_BITS) + np.arange(len(vectors), dtype="int64")
+            self.index.add_with_ids(vectors, ids)
+            self.slots[fileid] = slot
+            self.fileids[slot] = fileid
+            self.chunks[fileid] = chunks
+
+    def remove_file(self, fileid):
+        self._check_writable()
+        with self.lock:
+            self._remove(fileid)
+
+    def _check_writable(self):
+        # faiss aborts the process when a mapped index is modified
+        if self.mapped:
+            raise ValueError("A mapped collection is read-only")
+
+    def _remove(self, fileid):
+        slot = self.slots.pop(fileid, None)
+        if slot is None:
+            return
+        del self.fileids[slot]
+        del self.chunks[fileid]
+        self.index.remove_ids(faiss.IDSelectorRange(slot << CHUNK_BITS, (slot + 1) << CHUNK_BITS))
+
+    def search(self, query_embedding, k, fileids=None):
+        """
+        Search all files (or only the given fileids) and return a list of
+        (fileid, chunk_idx, chunk_text, distance) sorted by distance.
+        """
+        with self.lock:
+            selector = None
+            if fileids is not None:
+                slots = [self.slots[f] for f in fileids if f in self.slots]
+                if not slots:
+                    return []
+                ids = np.concatenate([
+                    (np.int64(slot) << CHUNK_BITS) + np.arange(len(self.chunks[self.fileids[slot]]), dtype="int64")
+                    for slot in slots
+                ])
+                selector = faiss.IDSelectorBatch(ids)
+            distances, ids = self.index.search(query_embedding, k, params=search_params(self.spec, selector))
+
+            results = []
+            for distance, vector_id in zip(distances[0], ids[0]):
+                if vector_id < 0:
+                    continue
+                fileid = self.fileids.get(int(vector_id) >> CHUNK_BITS)
+                if fileid is None:
+                    continue
+                chunk_idx = int(vector_id) & ((1 << CHUNK_BITS) - 1)
+                chunks = self.chunks[fileid]
+                if chunk_idx < len(chunks):
+                    results.append((fileid, chunk_idx, chunks[chunk_idx], float(distance)))
+            return results
+
+    def nbytes(self):
+        code_size = self.dimension * 4 if self.spec["type"] == "flat" else code_bytes(self.spec, self.dimension)
+        if self.mapped:
+            # Codes and inverted lists stay in the shared mapping; a flat collection still
+            # holds its id maps in memory
+            code_size = 16 if self.spec["type"] == "flat" else 0
+        vector_bytes = self.index.ntotal * (code_size + 8)
+        return vector_bytes + sum(chunks_nbytes(c) for c in self.chunks.values())
@@ -0,0 +1,228 @@
+"""
+Sentence embedding backends behind one interface: encode(texts) -> float32 array (n, d).
+
+    torch      sentence-transformers on PyTorch, the reference implementation
+    onnx       the same transformer exported to ONNX and run with ONNX Runtime
+    onnx-int8  the ONNX export with dynamically quantized int8 weights
+
+The ONNX backends need only onnxruntime, tokenizers and numpy at runtime, which start much
+faster and take far less memory than PyTorch. Like the all-MiniLM sentence-transformers
+models they mean-pool the token embeddings and L2-normalize the result. Export a model
+once (this step needs torch and transformers) and check it against PyTorch with:
+
+    python embedders.py export --model all-MiniLM-L6-v2 --out onnx_models/all-MiniLM-L6-v2
+    python embedders.py verify --backend onnx-int8 --model all-MiniLM-L6-v2 --onnx-dir onnx_models/all-MiniLM-L6-v2
+
+verify exits non-zero when any sentence's embedding falls below the cosine tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+# Minimum cosine similarity to the PyTorch embedding accepted by verify
+COSINE_TOLERANCE = {"onnx": 0.9999, "onnx-int8": 0.98}
+
+SAMPLE_TEXTS = [
+    "Warm-up query",
+    "What are the payment terms in this contract?",
+    "Summarize the key dates and deadlines.",
+    "The supplier shall deliver the goods within thirty (30) days of the purchase order.",
+    "Revenue grew 12% year over year, driven by subscription renewals in the enterprise segment.",
+    "Sheet: Orders\nid\tcustomer\tamount\n1\tAcme\t120.50\n2\tGlobex\t99",
+    "Termination for convenience requires ninety days written notice to the other party.",
+    "a",
+    " ".join(["long input to exercise truncation"] * 120),
+]
+
+
+def hub_name(model_name):
+    """sentence-transformers accepts bare names like all-MiniLM-L6-v2; the hub needs the org."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+class TorchEmbedder:
+    def __init__(self, model_name, device="cpu"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def encode(self, texts):
+        return np.asarray(self.model.encode(list(texts), convert_to_numpy=True), dtype="float32")
+
+
+class OnnxEmbedder:
+    """
+    Runs an exported transformer with ONNX Runtime. Texts are sorted by length and encoded in
+    batches of batch_size, so short texts are not padded to the longest one in the request.
+    """
+
+    def __init__(self, model_dir, quantized=False, threads=0, batch_size=32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "embedder.json")) as f:
+            config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(config["max_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_id"], pad_token=config["pad_token"])
+        self.normalize = config.get("normalize", True)
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(model_dir, ONNX_FILES["onnx-int8" if quantized else "onnx"])
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype="int64"),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype="int64"),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype="int64"),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+        mask = feeds["attention_mask"][:, :, None].astype("float32")
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype("float32")
+
+    def encode(self, texts):
+        texts = list(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = None
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embeddings = self._encode_batch([texts[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), embeddings.shape[1]), dtype="float32")
+            result[batch] = embeddings
+        return result if result is not None else np.zeros((0, 0), dtype="float32")
+
+
+def export_onnx(model_name, out_dir, max_length=256, quantize=True):
+    """Export model_name to out_dir as model.onnx (and model.int8.onnx) with its tokenizer."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(hub_name(model_name))
+    model = AutoModel.from_pretrained(hub_name(model_name)).eval()
+    sample = tokenizer(["an export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    axes = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(out_dir, ONNX_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{name: axes for name in input_names}, "last_hidden_state": axes},
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "embedder.json"), "w") as f:
+        json.dump({
+            "model": model_name,
+            "max_length": max_length,
+            "pad_id": tokenizer.pad_token_id,
+            "pad_token": tokenizer.pad_token,
+            "normalize": True,
+        }, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, os.path.join(out_dir, ONNX_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+    print(f"Exported {model_name} to {out_dir}")
+
+
+def create_embedder(backend, model_name, onnx_dir=None, threads=0):
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+    if backend not in ONNX_FILES:
+        raise ValueError(f"Unknown embedding backend {backend}; expected one of {BACKENDS}")
+    if not os.path.exists(os.path.join(onnx_dir, ONNX_FILES[backend])):
+        # Normally done at build time; exporting here needs torch and transformers installed
+        print(f"No ONNX export of {model_name} in {onnx_dir}; exporting it now")
+        export_onnx(model_name, onnx_dir, quantize=backend == "onnx-int8")
+    return OnnxEmbedder(onnx_dir, quantized=backend == "onnx-int8", threads=threads)
+
+
+def verify(backend, model_name, onnx_dir, texts=SAMPLE_TEXTS, tolerance=None, repeats=5):
+    """
+    Compare a backend's embeddings with the PyTorch reference. Returns a report with the
+    minimum and mean cosine similarity, time per text of both, and whether it passed.
+    """
+    tolerance = tolerance if tolerance is not None else COSINE_TOLERANCE.get(backend, 0.9999)
+    reference = TorchEmbedder(model_name)
+    candidate = create_embedder(backend, model_name, onnx_dir)
+
+    def timed(embedder):
+        embedder.encode(texts[:1])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            vectors = embedder.encode(texts)
+        return vectors, (time.perf_counter() - start) / (repeats * len(texts))
+
+    expected, reference_seconds = timed(reference)
+    actual, candidate_seconds = timed(candidate)
+    expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+    actual = actual / np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = np.sum(expected * actual, axis=1)
+    return {
+        "backend": backend,
+        "model": model_name,
+        "texts": len(texts),
+        "min_cosine": round(float(cosines.min()), 6),
+        "mean_cosine": round(float(cosines.mean()), 6),
+        "tolerance": tolerance,
+        "passed": bool(cosines.min() >= tolerance),
+        "torch_ms_per_text": round(reference_seconds * 1000, 3),
+        "backend_ms_per_text": round(candidate_seconds * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export a sentence-transformers model to ONNX")
+    export.add_argument("--model", default="all-MiniLM-L6-v2")
+    export.add_argument("--out", required=True)
+    export.add_argument("--max-length", type=int, default=256)
+    export.add_argument("--no-int8", action="store_true", help="Skip the int8 quantized model")
+
+    check = commands.add_parser("verify", help="Compare a backend with the PyTorch embeddings")
+    check.add_argument("--backend", choices=list(ONNX_FILES), default="onnx-int8")
+    check.add_argument("--model", default="all-MiniLM-L6-v2")
+    check.add_argument("--onnx-dir", required=True)
+    check.add_argument("--tolerance", type=float, help="Minimum cosine similarity per text")
+    check.add_argument("--texts-file", help="File with one text per line to compare on")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.out, args.max_length, quantize=not args.no_int8)
+        return
+    texts = SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file) as f:
+            texts = [line.rstrip("\n") for line in f if line.strip()]
+    report = verify(args.backend, args.model, args.onnx_dir, texts, args.tolerance)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def chunk_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-hash -> embedding cache in a local SQLite file.
+
+    Keys include the model name so switching embedders never returns stale vectors.
+    When max_entries is set, the least recently used entries are pruned once the table
+    holds prune_slack more rows than that, so inserts do not pay for a prune each time.
+    Hits refresh an entry's timestamp in batches of touch_batch keys.
+    """
+
+    def __init__(self, path, max_entries=None, prune_slack=0.1, touch_batch=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_at = int(max_entries * (1 + prune_slack)) if max_entries else None
+        self.touch_batch = touch_batch
+        self.touched = set()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_updated ON embeddings (updated)")
+        self.conn.commit()
+        # Rows in the table as far as this process knows; other processes sharing the file
+        # add to it as well, so the count is checked again before pruning
+        self.entries = self._count()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _touch(self, now):
+        keys = list(self.touched)
+        self.touched.clear()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"UPDATE embeddings SET updated = ? WHERE key IN ({placeholders})", [now, *batch])
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype="float32")
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+            if self.max_entries:
+                self.touched.update(found)
+                if len(self.touched) >= self.touch_batch:
+                    self._touch(time.time())
+                    self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype="float32").tobytes(), now) for key, vector in items]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, updated) VALUES (?, ?, ?)", rows)
+            self.entries += len(rows)
+            if self.max_entries and self.entries > self.prune_at:
+                self._touch(now)
+                self.entries = self._count()
+                if self.entries > self.prune_at:
+                    self.conn.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+                    self.entries = min(self.entries, self.max_entries)
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self._count()
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+QUERY = 0
+BULK = 1
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+
+
+class EmbeddingBatcher:
+    """
+    In-process embedding service that coalesces concurrent encode calls into batched
+    forward passes.
+
+    A single worker thread waits up to max_wait_ms after the first pending request for more
+    to arrive (or until max_batch_size texts are queued), runs one encode over all of them and
+    resolves each caller's future with its slice of the result. Query requests are served
+    before bulk (ingestion) requests, and bulk requests are split into max_batch_size pieces
+    so a large upload never holds a query back for more than one batch. Repeated query
+    strings are answered from a small LRU cache without touching the model.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=5, cache_size=1024):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.queues = (deque(), deque())
+        self.queued_texts = 0
+        self.cond = threading.Condition()
+        self.batches = 0
+        self.batched_texts = 0
+        self.cache_hits = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, priority=BULK):
+        """Queue texts for encoding and return a Future resolving to a (len(texts), dim) array."""
+        texts = list(texts)
+        if priority == QUERY or len(texts) <= self.max_batch_size:
+            requests = [_Request(texts)]
+        else:
+            requests = [
+                _Request(texts[i:i + self.max_batch_size])
+                for i in range(0, len(texts), self.max_batch_size)
+            ]
+        with self.cond:
+            for request in requests:
+                self.queues[priority].append(request)
+                self.queued_texts += len(request.texts)
+            self.cond.notify()
+        if len(requests) == 1:
+            return requests[0].future
+        return _gather(requests)
+
+    def encode(self, texts):
+        """Blocking batched encode, for worker threads."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        return self.submit(texts, BULK).result()
+
+    def encode_query(self, text):
+        return self.submit_query(text).result()
+
+    async def encode_query_async(self, text):
+        return await asyncio.wrap_future(self.submit_query(text))
+
+    def submit_query(self, text):
+        with self.cache_lock:
+            vector = self.cache.get(text)
+            if vector is not None:
+                self.cache.move_to_end(text)
+                self.cache_hits += 1
+                future = Future()
+                future.set_result(vector)
+                return future
+        future = self.submit([text], QUERY)
+        future.add_done_callback(lambda f: self._remember(text, f))
+        return future
+
+    def _remember(self, text, future):
+        if future.exception() is not None or not self.cache_size:
+            return
+        with self.cache_lock:
+            self.cache[text] = future.result()
+            self.cache.move_to_end(text)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _collect(self):
+        with self.cond:
+            while not self.queued_texts:
+                self.cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while self.queued_texts < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = []
+            size = 0
+            for queue in self.queues:
+                while queue and (not batch or size + len(queue[0].texts) <= self.max_batch_size):
+                    request = queue.popleft()
+                    batch.append(request)
+                    size += len(request.texts)
+            self.queued_texts -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_texts += len(texts)
+            start = 0
+            for request in batch:
+                end = start + len(request.texts)
+                # A copy, so a cached query vector does not keep the whole batch array alive
+                request.future.set_result(embeddings[start:end].copy())
+                start = end
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.batched_texts,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else None,
+            "query_cache_hits": self.cache_hits,
+            "query_cache_entries": len(self.cache),
+        }
+
+
+def _gather(requests):
+    """Combine the futures of a split bulk request into one future of the stacked result."""
+    combined = Future()
+    remaining = [len(requests)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [r.future.exception() for r in requests if r.future.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result(np.vstack([r.future.result() for r in requests]))
+
+    for request in requests:
+        request.future.add_done_callback(done)
+    return combined
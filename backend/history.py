@@ -0,0 +1,187 @@
+"""
+Conversation history per (uid, fileid), capped at max_turns turns, behind a pluggable backend.
+
+    MemoryHistory     ring buffers in this process; at most max_conversations are kept (least
+                      recently used dropped), and nothing survives a restart
+    SQLiteHistory     a local SQLite file shared by all workers on the host, surviving restarts
+    FirestoreHistory  the users/{uid}/files/{fileid}/chats documents the frontend already writes;
+                      turns are only written here when write=True
+
+Whatever the backend, format_history fits the turns into a token budget for the prompt: the
+newest turns are kept first, and only the latest answer is kept at length, so earlier
+answers are cut to a short excerpt instead of inflating every prompt.
+"""
+import datetime
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Conversations over several files (collection queries) are kept under this key
+COLLECTION_KEY = "_collection"
+
+
+def iso_timestamp(offset_ms=0):
+    """UTC time formatted like JavaScript's toISOString(), as the frontend stores it."""
+    now = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(milliseconds=offset_ms)
+    return now.strftime("%Y-%m-%dT%H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text to about max_tokens tokens at a word boundary."""
+    text = " ".join(text.split())
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4].rsplit(" ", 1)[0]
+    return cut.rstrip(".,;:") + " …"
+
+
+def format_history(turns, budget_tokens, recent_answer_tokens=200, older_answer_tokens=40, question_tokens=100):
+    """
+    Render (question, answer) turns, oldest first, as the prompt's chat history in at most
+    about budget_tokens tokens. Turns are taken newest first until the budget is used up.
+    """
+    lines = []
+    used = 0
+    for age, (question, answer) in enumerate(reversed(turns)):
+        answer_tokens = recent_answer_tokens if age == 0 else older_answer_tokens
+        turn = f"User: {truncate_tokens(question, question_tokens)}\nAssistant: {truncate_tokens(answer, answer_tokens)}"
+        cost = estimate_tokens(turn)
+        if used + cost > budget_tokens:
+            break
+        lines.append(turn)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+class MemoryHistory:
+    def __init__(self, max_turns=20, max_conversations=10000):
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.conversations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def turns(self, uid, fileid):
+        with self.lock:
+            turns = self.conversations.get((uid, fileid))
+            if turns is None:
+                return []
+            self.conversations.move_to_end((uid, fileid))
+            return list(turns)
+
+    def append(self, uid, fileid, question, answer):
+        with self.lock:
+            turns = self.conversations.get((uid, fileid))
+            if turns is None:
+                turns = self.conversations[(uid, fileid)] = deque(maxlen=self.max_turns)
+            self.conversations.move_to_end((uid, fileid))
+            turns.append((question, answer))
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+
+    def drop_user(self, uid):
+        with self.lock:
+            for key in [k for k in self.conversations if k[0] == uid]:
+                del self.conversations[key]
+
+
+class SQLiteHistory:
+    def __init__(self, path, max_turns=20, timeout=30):
+        self.max_turns = max_turns
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, uid TEXT NOT NULL, "
+            "fileid TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS history_conversation ON history (uid, fileid, id)")
+        self.conn.commit()
+
+    def turns(self, uid, fileid):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT question, answer FROM history WHERE uid = ? AND fileid = ? ORDER BY id DESC LIMIT ?",
+                (uid, fileid, self.max_turns),
+            ).fetchall()
+        return rows[::-1]
+
+    def append(self, uid, fileid, question, answer):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO history (uid, fileid, question, answer, created) VALUES (?, ?, ?, ?, ?)",
+                (uid, fileid, question, answer, time.time()),
+            )
+            # Keep only the newest max_turns turns of the conversation
+            self.conn.execute(
+                "DELETE FROM history WHERE uid = ? AND fileid = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE uid = ? AND fileid = ? ORDER BY id DESC LIMIT ?)",
+                (uid, fileid, uid, fileid, self.max_turns),
+            )
+            self.conn.commit()
+
+    def drop_user(self, uid):
+        with self.lock:
+            self.conn.execute("DELETE FROM history WHERE uid = ?", (uid,))
+            self.conn.commit()
+
+
+class FirestoreHistory:
+    """
+    Reads turns from the chat messages ({"type": "user" | "model", "text", "timestamp"}) stored
+    under each file. The frontend writes both messages of a turn itself, including the
+    question being answered before it calls /query, so a trailing unanswered question is skipped.
+    """
+
+    def __init__(self, firestore_client, max_turns=20, write=False):
+        self.firestore_client = firestore_client
+        self.max_turns = max_turns
+        self.write = write
+
+    def _chats(self, uid, fileid):
+        return (
+            self.firestore_client.collection("users").document(uid)
+            .collection("files").document(fileid).collection("chats")
+        )
+
+    def turns(self, uid, fileid):
+        if fileid == COLLECTION_KEY:
+            return []
+        query = self._chats(uid, fileid).order_by("timestamp", direction="DESCENDING").limit(self.max_turns * 2 + 1)
+        messages = [doc.to_dict() for doc in query.stream()][::-1]
+        turns = []
+        question = None
+        for message in messages:
+            if message.get("type") == "user":
+                question = message.get("text", "")
+            elif message.get("type") == "model" and question is not None:
+                turns.append((question, message.get("text", "")))
+                question = None
+        return turns[-self.max_turns:]
+
+    def append(self, uid, fileid, question, answer):
+        if not self.write or fileid == COLLECTION_KEY:
+            return
+        chats = self._chats(uid, fileid)
+        chats.add({"type": "user", "text": question, "timestamp": iso_timestamp()})
+        chats.add({"type": "model", "text": answer, "timestamp": iso_timestamp(offset_ms=1)})
+
+    def drop_user(self, uid):
+        # The chat documents are deleted with the user's files by the purge job
+        pass
+
+
+def create_history_store(name, max_turns=20, **options):
+    """Build the history backend selected by HISTORY_BACKEND: "memory", "sqlite" or "firestore"."""
+    if name == "memory":
+        return MemoryHistory(max_turns, options.get("max_conversations", 10000))
+    if name == "sqlite":
+        return SQLiteHistory(options["path"], max_turns)
+    if name == "firestore":
+        return FirestoreHistory(options["firestore_client"], max_turns, write=options.get("write", False))
+    raise ValueError(f"Unknown history backend {name}")
@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def chunks_nbytes(chunks):
+    """Approximate resident size of a list of chunk strings or a mapped ChunkStore."""
+    if hasattr(chunks, "nbytes"):
+        return chunks.nbytes
+    return sys.getsizeof(chunks) + sum(sys.getsizeof(c) for c in chunks)
+
+
+class CacheEntry:
+    def __init__(self, index, chunks, nbytes, path=None, version=None):
+        self.index = index
+        self.chunks = chunks
+        self.nbytes = nbytes
+        self.path = path
+        self.version = version
+        self.last_used = time.time()
+
+
+class IndexCache:
+    """
+    LRU cache of loaded FAISS indexes and their chunks, keyed by (uid, fileid).
+
+    Entries are accounted by the bytes of the index plus its chunks; the least recently
+    used entries are evicted once the total exceeds max_bytes, and entries idle for longer
+    than ttl seconds (if set) are dropped on access. The entry being inserted is never
+    evicted, so a single index larger than the budget still loads. on_evict(entry) is
+    called for every entry that leaves the cache, e.g. to remove its local files. An entry
+    can carry a version, for callers that check it against a newer one before using it.
+    """
+
+    def __init__(self, max_bytes, ttl=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.last_used = time.time()
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, index, chunks, index_nbytes, path=None, version=None):
+        entry = CacheEntry(index, chunks, index_nbytes + chunks_nbytes(chunks), path, version)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+                if old.path != path:
+                    self._evicted(old)
+            self.entries[key] = entry
+            self.total_bytes += entry.nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+                self._evicted(evicted)
+                print(f"Evicted index {evicted_key} from cache ({evicted.nbytes} bytes)")
+        return entry
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.nbytes
+                self._evicted(entry)
+            return entry
+
+    def drop_user(self, uid):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == uid]:
+                entry = self.entries.pop(key)
+                self.total_bytes -= entry.nbytes
+                self._evicted(entry)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        for key in [k for k, e in self.entries.items() if e.last_used < cutoff]:
+            entry = self.entries.pop(key)
+            self.total_bytes -= entry.nbytes
+            self.expirations += 1
+            self._evicted(entry)
+
+    def _evicted(self, entry):
+        if self.on_evict is not None:
+            try:
+                self.on_evict(entry)
+            except Exception as e:
+                print(f"Error releasing evicted cache entry: {str(e)}")
+
+    def stats(self):
+        with self.lock:
+            self._expire()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
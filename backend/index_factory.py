@@ -0,0 +1,202 @@
+"""
+Pick and build a FAISS index type from the number of vectors and the memory/recall targets.
+
+An index spec is a plain dict, {"type": ..., "params": {...}}, so it can be stored next to
+the file metadata in Firestore and used to restore search-time parameters after loading.
+
+    flat     exact search, d * 4 bytes per vector; used for small indexes
+    hnsw     graph search, sublinear with high recall; roughly d * 4 + 2 * M * 4 bytes per vector
+    ivfflat  inverted lists over full vectors; supports removal, used for large collections
+    ivfsq    inverted lists over scalar-quantized codes; d * bits / 8 bytes (+ id) per vector
+    ivfpq    inverted lists over product-quantized codes; m bytes (+ id) per vector
+
+Without a memory budget, large per-file indexes are HNSW, which is faster to search than
+flat but takes more memory (about 1.8 KB per 384-d vector against 1.5 KB for flat); set
+INDEX_MEMORY_BYTES_PER_VECTOR to trade search speed for memory. Under a budget the largest
+code that fits is used, unless its estimated recall misses the recall target: then the
+smallest code that meets it is used instead, even though it is over budget.
+"""
+import os
+
+import faiss
+import numpy as np
+
+FLAT_MAX_VECTORS = int(os.getenv("INDEX_FLAT_MAX_VECTORS", 20000))
+# Optional budget in bytes per vector; when set, indexes that need more memory are ruled out
+# (HNSW needs d * 4 + 256 bytes per vector, flat d * 4)
+MEMORY_BYTES_PER_VECTOR = int(os.getenv("INDEX_MEMORY_BYTES_PER_VECTOR", 0)) or None
+RECALL_TARGET = float(os.getenv("INDEX_RECALL_TARGET", 0.95))
+
+HNSW_M = 32
+PQ_SUBQUANTIZERS = [96, 64, 48, 32, 24, 16, 12, 8, 4]
+# Per-id overhead of inverted list entries
+IVF_ID_BYTES = 8
+IVF_TYPES = ("ivfflat", "ivfsq", "ivfpq")
+SQ_TYPES = {8: faiss.ScalarQuantizer.QT_8bit, 6: faiss.ScalarQuantizer.QT_6bit, 4: faiss.ScalarQuantizer.QT_4bit}
+# Recall@3 against exact search by code size in bits per dimension, measured with
+# benchmarks/index_benchmark.py on 384-d sentence-like vectors (50k vectors, 512 lists)
+SQ_RECALL = {8: 0.98, 6: 0.96, 4: 0.83}
+PQ_RECALL_BITS = [0.5, 1, 2]
+PQ_RECALL = [0.51, 0.61, 0.77]
+
+
+def _hnsw_ef_search(recall_target):
+    if recall_target >= 0.99:
+        return 256
+    if recall_target >= 0.95:
+        return 96
+    if recall_target >= 0.9:
+        return 48
+    return 24
+
+
+def _nlist(n_vectors):
+    # ~4 * sqrt(n) lists, with enough points per list to train the coarse quantizer
+    nlist = 1 << int(np.log2(max(4 * np.sqrt(n_vectors), 1)))
+    return int(max(1, min(nlist, n_vectors // 39, 65536)))
+
+
+def _nprobe(nlist, recall_target):
+    if recall_target >= 0.99:
+        fraction = 1 / 4
+    elif recall_target >= 0.95:
+        fraction = 1 / 16
+    elif recall_target >= 0.9:
+        fraction = 1 / 32
+    else:
+        fraction = 1 / 64
+    return int(max(1, min(nlist, round(nlist * fraction), 256)))
+
+
+def code_bytes(spec, dimension):
+    """Bytes stored per vector by an IVF spec (flat vectors, SQ or PQ codes), without the id."""
+    params = spec.get("params") or {}
+    if spec["type"] == "ivfpq":
+        return (params["m"] * params["nbits"] + 7) // 8
+    if spec["type"] == "ivfsq":
+        return (dimension * params["bits"] + 7) // 8
+    return dimension * 4
+
+
+def estimated_recall(spec, dimension):
+    """Recall ceiling of an IVF spec's codes relative to exact search."""
+    params = spec.get("params") or {}
+    if spec["type"] == "ivfsq":
+        return SQ_RECALL[params["bits"]]
+    if spec["type"] == "ivfpq":
+        return float(np.interp(params["m"] * params["nbits"] / dimension, PQ_RECALL_BITS, PQ_RECALL))
+    return 1.0
+
+
+def _ivf_candidates(n_vectors, dimension, nlist, nprobe):
+    """IVF specs from the largest code to the smallest."""
+    ivf = {"nlist": nlist, "nprobe": nprobe}
+    candidates = [{"type": "ivfflat", "params": dict(ivf)}]
+    candidates += [{"type": "ivfsq", "params": {**ivf, "bits": bits}} for bits in SQ_TYPES]
+    # 8-bit codebooks need ~39 * 256 training points; use smaller codebooks below that
+    nbits = 8 if n_vectors >= 39 * 256 else max(4, int(np.log2(max(n_vectors // 39, 1))))
+    candidates += [
+        {"type": "ivfpq", "params": {**ivf, "m": m, "nbits": nbits}}
+        for m in PQ_SUBQUANTIZERS if dimension % m == 0
+    ]
+    return candidates
+
+
+def choose_index_spec(n_vectors, dimension, memory_bytes_per_vector=MEMORY_BYTES_PER_VECTOR,
+                      recall_target=RECALL_TARGET, removable=False, flat_max_vectors=FLAT_MAX_VECTORS):
+    """
+    Pick an index type for n_vectors of the given dimension.
+
+    removable=True restricts the choice to index types that support remove_ids and
+    add_with_ids (used for per-user collections), which rules out HNSW.
+    """
+    if n_vectors <= flat_max_vectors:
+        return {"type": "flat", "params": {}}
+
+    budget = memory_bytes_per_vector
+    nlist = _nlist(n_vectors)
+    nprobe = _nprobe(nlist, recall_target)
+
+    if not removable and (budget is None or budget >= dimension * 4 + 2 * HNSW_M * 4):
+        return {
+            "type": "hnsw",
+            "params": {"M": HNSW_M, "efConstruction": 80, "efSearch": _hnsw_ef_search(recall_target)},
+        }
+
+    candidates = _ivf_candidates(n_vectors, dimension, nlist, nprobe)
+    if budget is None:
+        return candidates[0]
+    fitting = [c for c in candidates if code_bytes(c, dimension) + IVF_ID_BYTES <= budget] or candidates[-1:]
+    spec = fitting[0]
+    if estimated_recall(spec, dimension) < recall_target:
+        # Compressed codes that cannot reach the target would return poor matches; spend the memory instead
+        accurate = [c for c in candidates if estimated_recall(c, dimension) >= recall_target]
+        if accurate:
+            spec = accurate[-1]
+            print(
+                f"Index budget of {budget} bytes per vector cannot reach recall {recall_target}; "
+                f"using {spec['type']} at {code_bytes(spec, dimension) + IVF_ID_BYTES} bytes per vector"
+            )
+    return spec
+
+
+def _training_sample(vectors, nlist):
+    max_train = max(nlist * 256, 10000)
+    if len(vectors) <= max_train:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), max_train, replace=False)]
+
+
+def create_index(dimension, spec, training_vectors=None):
+    """Create an empty index for the spec, trained on training_vectors if the type needs it."""
+    kind = spec["type"]
+    params = spec.get("params", {})
+    if kind == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+    elif kind in IVF_TYPES:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivfflat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"])
+        elif kind == "ivfsq":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, params["nlist"], SQ_TYPES[params["bits"]])
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"])
+        index.train(np.ascontiguousarray(_training_sample(training_vectors, params["nlist"]), dtype="float32"))
+    else:
+        raise ValueError(f"Unknown index type {kind}")
+    apply_search_params(index, spec)
+    return index
+
+
+def build_index(vectors, spec):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = create_index(vectors.shape[1], spec, vectors)
+    index.add(vectors)
+    return index
+
+
+def apply_search_params(index, spec):
+    """Restore search-time parameters that FAISS does not serialize with the index."""
+    if not spec:
+        return index
+    params = spec.get("params") or {}
+    if spec.get("type") == "hnsw" and "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+    elif spec.get("type") in IVF_TYPES and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    return index
+
+
+def search_params(spec, selector=None):
+    """SearchParameters carrying the spec's search settings and an optional id selector."""
+    params = (spec or {}).get("params") or {}
+    kind = (spec or {}).get("type")
+    if kind in IVF_TYPES:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=params.get("nprobe", 1))
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=params.get("efSearch", 16))
+    return faiss.SearchParameters(sel=selector)
@@ -0,0 +1,184 @@
+"""
+Host-wide registry of loaded per-file indexes, shared by all uvicorn workers.
+
+Each file's FAISS index and chunk store live under directory/<uid>/<fileid>.* on local
+disk, and every worker maps them read-only instead of reading its own copy: N workers
+serving the same file share one set of pages in the page cache. A JSON sidecar written
+last marks an entry as complete and records its index spec and the blob generations it
+was copied from, so callers can check it is still current. Downloads are serialized per
+file with an advisory file lock, so a file is fetched from GCS once per host.
+
+Entries without a chunk store hold indexes over several files, such as a user's collection
+index; the sidecar then carries whatever else is needed to use the index.
+
+Files are only ever replaced or unlinked, never modified in place, so removing an entry
+(purge, disk budget) is safe while other workers still have it mapped; the pages go away
+with the last mapping.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+
+import faiss
+
+from chunk_store import ChunkStore
+from index_factory import apply_search_params
+
+# Map inverted lists instead of reading them into memory
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+# Flat codes (IndexFlat, HNSW storage) can be mapped as well; IVF indexes fail to load with it
+MMAP_CODES_FLAGS = MMAP_FLAGS | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+MMAP_CODES_TYPES = ("flat", "hnsw")
+
+
+def mmap_flags(spec):
+    """faiss.read_index flags that map as much of an index of the given spec as it supports."""
+    return MMAP_CODES_FLAGS if (spec or {}).get("type", "flat") in MMAP_CODES_TYPES else MMAP_FLAGS
+
+
+class IndexRegistry:
+    def __init__(self, directory, max_bytes=None, mmap=True):
+        self.directory = directory
+        self.max_bytes = max_bytes or None
+        self.mmap = mmap
+        os.makedirs(directory, exist_ok=True)
+
+    def _base(self, uid, fileid):
+        return os.path.join(self.directory, uid, fileid)
+
+    def paths(self, uid, fileid):
+        base = self._base(uid, fileid)
+        return f"{base}.index", f"{base}.chunks", f"{base}.json"
+
+    @contextlib.contextmanager
+    def lock(self, uid, fileid):
+        """Exclusive lock across processes for populating one entry."""
+        os.makedirs(os.path.join(self.directory, uid), exist_ok=True)
+        with open(f"{self._base(uid, fileid)}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def meta(self, uid, fileid):
+        """Return the sidecar of a complete entry ({"spec", "sources", ...}), or None."""
+        try:
+            with open(self.paths(uid, fileid)[2]) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open(self, uid, fileid):
+        """
+        Map an entry read-only. Returns (index, chunks, index_nbytes, chunks_path), or None if
+        no worker has published the file yet or it was removed while being opened.
+        """
+        _, chunks_path, _ = self.paths(uid, fileid)
+        opened = self.open_index(uid, fileid)
+        if opened is None:
+            return None
+        index, _, index_nbytes = opened
+        try:
+            chunks = ChunkStore.open(chunks_path)
+        except FileNotFoundError:
+            return None
+        return index, chunks, index_nbytes, chunks_path
+
+    def open_index(self, uid, fileid):
+        """
+        Map only an entry's index. Returns (index, sidecar, index_nbytes), or None if the
+        entry does not exist or was removed while being opened. Mapped indexes are read-only:
+        adding to or removing from them is not supported.
+        """
+        index_path, _, meta_path = self.paths(uid, fileid)
+        meta = self.meta(uid, fileid)
+        if meta is None:
+            return None
+        try:
+            index_nbytes = os.path.getsize(index_path)
+            index = faiss.read_index(index_path, mmap_flags(meta.get("spec")) if self.mmap else 0)
+            # The sidecar's mtime is the entry's last use, for the disk budget
+            os.utime(meta_path)
+        except FileNotFoundError:
+            return None
+        except RuntimeError:
+            # faiss reports a file pruned after the checks above as a RuntimeError
+            if not os.path.exists(index_path):
+                return None
+            raise
+        return apply_search_params(index, meta.get("spec")), meta, index_nbytes
+
+    def publish(self, uid, fileid, index_file, chunks_file, spec, sources=None, extra=None):
+        """
+        Move a written index and chunk store (None for index-only entries) into the registry;
+        the files are consumed. sources records where they came from, e.g.
+        {"index": [blob_name, generation], ...}; extra is stored in the sidecar as well.
+        """
+        index_path, chunks_path, meta_path = self.paths(uid, fileid)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        os.replace(index_file, index_path)
+        if chunks_file is not None:
+            os.replace(chunks_file, chunks_path)
+        tmp_meta = f"{meta_path}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump({**(extra or {}), "spec": spec, "sources": sources}, f)
+        os.replace(tmp_meta, meta_path)
+        self.prune(keep=(uid, fileid))
+
+    def drop_user(self, uid):
+        shutil.rmtree(os.path.join(self.directory, uid), ignore_errors=True)
+
+    def _remove(self, uid, fileid):
+        # Sidecar first, so the entry stops being visible before its files disappear
+        for path in reversed(self.paths(uid, fileid)):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def entries(self):
+        """Return [(last_used, nbytes, uid, fileid)] for every complete entry."""
+        found = []
+        for uid in os.listdir(self.directory):
+            user_dir = os.path.join(self.directory, uid)
+            if not os.path.isdir(user_dir):
+                continue
+            for name in os.listdir(user_dir):
+                if not name.endswith(".json"):
+                    continue
+                fileid = name[:-len(".json")]
+                index_path, chunks_path, meta_path = self.paths(uid, fileid)
+                try:
+                    last_used = os.path.getmtime(meta_path)
+                    nbytes = os.path.getsize(index_path)
+                except FileNotFoundError:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    nbytes += os.path.getsize(chunks_path)
+                found.append((last_used, nbytes, uid, fileid))
+        return found
+
+    def prune(self, keep=None):
+        """Remove the least recently used entries until the registry fits in max_bytes."""
+        if not self.max_bytes:
+            return
+        entries = sorted(self.entries())
+        total = sum(nbytes for _, nbytes, _, _ in entries)
+        for _, nbytes, uid, fileid in entries:
+            if total <= self.max_bytes:
+                break
+            if (uid, fileid) == keep:
+                continue
+            self._remove(uid, fileid)
+            total -= nbytes
+            print(f"Removed index {uid}/{fileid} from the local registry ({nbytes} bytes)")
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(nbytes for _, nbytes, _, _ in entries),
+            "max_bytes": self.max_bytes,
+            "mmap": self.mmap,
+        }
@@ -0,0 +1,213 @@
+import contextvars
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Stages every ingested file goes through, in order
+INGEST_STAGES = ["extract", "chunk", "embed", "index", "persist"]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobItem:
+    """One unit of work inside a job (e.g. one uploaded file) with per-stage progress."""
+
+    def __init__(self, job, name, stages):
+        self.job = job
+        self.name = name
+        self.status = "queued"
+        self.stage = None
+        self.stages = {s: {"status": "pending", "progress": 0.0, "seconds": None} for s in stages}
+        self.result = None
+        self.error = None
+        self._stage_started = {}
+
+    def start_stage(self, stage):
+        """Finish every running stage and start the given one."""
+        with self.job.lock:
+            self._finish_running(status="done")
+            self._start(stage)
+
+    def stage_progress(self, stage, fraction=None, count=None):
+        """
+        Report progress on a stage without finishing the others, for pipelines where
+        several stages run at the same time. Starts the stage if it hasn't started yet.
+        """
+        with self.job.lock:
+            entry = self.stages.get(stage)
+            if entry is None or entry["status"] == "pending":
+                self._start(stage)
+                entry = self.stages[stage]
+            if fraction is not None:
+                entry["progress"] = round(min(max(fraction, 0.0), 1.0), 3)
+            if count is not None:
+                entry["count"] = count
+
+    def _start(self, stage):
+        self.status = "running"
+        self.stage = stage
+        self.stages.setdefault(stage, {"status": "pending", "progress": 0.0, "seconds": None})
+        self.stages[stage]["status"] = "running"
+        self._stage_started[stage] = time.time()
+
+    def _finish_running(self, status):
+        for stage, entry in self.stages.items():
+            if entry["status"] != "running":
+                continue
+            entry["status"] = status
+            if status == "done":
+                entry["progress"] = 1.0
+            entry["seconds"] = round(time.time() - self._stage_started[stage], 3)
+            if self.job.on_stage is not None:
+                self.job.on_stage(self.job, self, stage, entry)
+
+    def finish(self, result):
+        with self.job.lock:
+            self._finish_running(status="done")
+            self.status = "done"
+            self.stage = None
+            self.result = result
+
+    def fail(self, error):
+        with self.job.lock:
+            self._finish_running(status="failed")
+            self.status = "failed"
+            self.error = error
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": {s: dict(v) for s, v in self.stages.items()},
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class Job:
+    def __init__(self, kind, uid, names, stages, trace_id=None, on_stage=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.uid = uid
+        self.trace_id = trace_id
+        self.on_stage = on_stage
+        self.lock = threading.Lock()
+        self.created = time.time()
+        self.finished = None
+        self.items = [JobItem(self, name, stages) for name in names]
+
+    @property
+    def status(self):
+        states = {item.status for item in self.items}
+        if states <= {"queued"}:
+            return "queued"
+        if states & {"queued", "running"}:
+            return "running"
+        if states == {"done"}:
+            return "done"
+        if states == {"failed"}:
+            return "failed"
+        return "partial"
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "uid": self.uid,
+                "trace_id": self.trace_id,
+                "status": self.status,
+                "created": self.created,
+                "finished": self.finished,
+                "items": [item.to_dict() for item in self.items],
+            }
+
+
+class JobQueue:
+    """
+    Bounded job queue backed by a thread pool.
+
+    Every item of a job is scheduled as its own task, so the stages of several files in one
+    request overlap (one file can be embedding while the next is still being extracted).
+    Submissions beyond max_pending outstanding items are rejected with JobQueueFull.
+
+    Items run in a copy of the submitter's context, so context variables such as the trace id
+    follow the work onto the pool. on_stage(job, item, stage, entry) is called whenever a
+    stage finishes, with the job lock held. on_update(job) is called when a job is submitted
+    and when it finishes, e.g. to publish its status to other processes.
+    """
+
+    def __init__(self, max_workers, max_pending, ttl=3600, on_stage=None, on_update=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.on_stage = on_stage
+        self.on_update = on_update
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, kind, uid, items, stages=INGEST_STAGES, trace_id=None):
+        """
+        items is a list of (name, fn) pairs; fn(item) runs on the pool and its return value
+        becomes the item's result. Exceptions mark the item as failed.
+        """
+        with self.lock:
+            self._prune()
+            if self.pending + len(items) > self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({self.pending} items pending)")
+            self.pending += len(items)
+            job = Job(kind, uid, [name for name, _ in items], stages, trace_id, self.on_stage)
+            self.jobs[job.id] = job
+
+        self._updated(job)
+        for item, (_, fn) in zip(job.items, items):
+            self.executor.submit(contextvars.copy_context().run, self._run, job, item, fn)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def unfinished(self):
+        with self.lock:
+            return [job for job in self.jobs.values() if job.finished is None]
+
+    def _run(self, job, item, fn):
+        try:
+            item.finish(fn(item))
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            print(f"Job {job.id} item {item.name} failed: {detail}")
+            traceback.print_exc()
+            item.fail(detail)
+        finally:
+            with self.lock:
+                self.pending -= 1
+            with job.lock:
+                finished = job.finished is None and all(i.status in ("done", "failed") for i in job.items)
+                if finished:
+                    job.finished = time.time()
+            if finished:
+                self._updated(job)
+
+    def _updated(self, job):
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Error publishing job {job.id}: {str(e)}")
+
+    def _prune(self):
+        now = time.time()
+        expired = [jid for jid, job in self.jobs.items() if job.finished and now - job.finished > self.ttl]
+        for jid in expired:
+            del self.jobs[jid]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
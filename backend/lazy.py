@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class Lazy:
+    """
+    Stand-in for a client or model that is built on first use. Attribute access is
+    forwarded to the object, which is created once by factory() (thread-safe), so module
+    globals can be declared at import time without waiting on credentials, network calls or
+    model loading.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self.error = None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    start = time.perf_counter()
+                    try:
+                        self._value = self._factory()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.error = None
+                    print(f"Initialized {self._name} in {time.perf_counter() - start:.2f}s")
+        return self._value
+
+    @property
+    def initialized(self):
+        return self._value is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import random
+
+import httpx
+
+
+class LLMError(Exception):
+    pass
+
+
+class DeepSeekClient:
+    """
+    Async client for an OpenAI-compatible chat completions endpoint (DeepSeek by default).
+
+    A single pooled httpx.AsyncClient keeps TLS connections alive between questions,
+    an asyncio.Semaphore caps in-flight completions, and transient failures (connect
+    errors, timeouts, 429 and 5xx responses) are retried with exponential backoff.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_url, api_key, timeout=60.0, connect_timeout=5.0, max_retries=2,
+                 max_concurrency=32, max_connections=64, keepalive_expiry=60.0):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+        return self._client
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _backoff(self, attempt):
+        await asyncio.sleep(min(0.25 * (2 ** attempt), 4.0) * (0.5 + random.random() / 2))
+
+    async def complete(self, payload):
+        """Send a non-streaming completion request and return the message content."""
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.client.post(self.api_url, json={**payload, "stream": False})
+                except (httpx.TransportError, httpx.TimeoutException) as e:
+                    if attempt < self.max_retries:
+                        await self._backoff(attempt)
+                        continue
+                    raise LLMError(f"DeepSeek API request failed: {str(e)}")
+                if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                    await self._backoff(attempt)
+                    continue
+                if response.status_code != 200:
+                    raise LLMError(f"DeepSeek API error: {response.text}")
+                return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, payload):
+        """
+        Send a streaming completion request and yield content deltas as they arrive.
+        Retries only happen before the first token has been yielded.
+        """
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self.client.stream("POST", self.api_url, json={**payload, "stream": True}) as response:
+                        if response.status_code != 200:
+                            body = (await response.aread()).decode("utf-8", "replace")
+                            if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                                await self._backoff(attempt)
+                                continue
+                            raise LLMError(f"DeepSeek API error: {body}")
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                return
+                            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                            if delta:
+                                yield delta
+                        return
+                except (httpx.TransportError, httpx.TimeoutException) as e:
+                    # Safe to retry only while nothing has been sent to the caller
+                    if attempt < self.max_retries and _is_connect_error(e):
+                        await self._backoff(attempt)
+                        continue
+                    raise LLMError(f"DeepSeek API request failed: {str(e)}")
+
+
+def _is_connect_error(error):
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
@@ -0,0 +1,395 @@
+"""
+Local stand-ins for the cloud clients used by main.py, selected with QUERYFILE_BACKEND=local.
+
+    LocalStorageClient   filesystem-backed blob store with the google.cloud.storage calls we use
+    LocalFirestore       in-memory document store with the google.cloud.firestore calls we use
+    LocalVisionClient    "OCR" that reads the PDF text layer with PyMuPDF and writes Vision-style output
+    LocalAuth            stand-in for firebase_admin.auth
+
+They implement only what the service calls, closely enough to run the app, the benchmark
+harness and the purge/ingestion code paths offline without credentials.
+"""
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:  # pragma: no cover - the cloud libraries are normally installed
+    class NotFound(Exception):
+        pass
+
+try:
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+except ImportError:  # pragma: no cover
+    SERVER_TIMESTAMP = object()
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+# ---------------------------------------------------------------------------
+# Blob storage
+# ---------------------------------------------------------------------------
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+        self.time_created = None
+        self.generation = None
+        self.size = None
+        self.etag = None
+        if os.path.exists(self.path):
+            self._load_stat()
+
+    def _load_stat(self):
+        st = os.stat(self.path)
+        self.time_created = datetime.datetime.fromtimestamp(st.st_ctime, datetime.timezone.utc)
+        self.generation = st.st_mtime_ns
+        self.size = st.st_size
+        self.etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def reload(self):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self._load_stat()
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{uuid.uuid4().hex}.part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+        self._load_stat()
+
+    def upload_from_filename(self, filename):
+        with open(filename, "rb") as f:
+            self._write(f.read())
+
+    def upload_from_string(self, data, content_type=None):
+        self._write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def download_as_bytes(self):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    download_as_string = download_as_bytes
+
+    def download_to_filename(self, filename):
+        if not self.exists():
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        shutil.copyfile(self.path, filename)
+
+    def delete(self):
+        self.bucket.delete_blob(self.name)
+
+
+class LocalBucket:
+    def __init__(self, root, name):
+        self.name = name
+        self.root = os.path.join(root, name)
+        os.makedirs(self.root, exist_ok=True)
+
+    def blob(self, name):
+        return LocalBlob(self, name)
+
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=""):
+        names = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".part"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return [LocalBlob(self, name) for name in sorted(names)]
+
+    def delete_blob(self, name):
+        path = os.path.join(self.root, name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            raise NotFound(f"No such object: {self.name}/{name}")
+
+
+class LocalStorageClient:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def bucket(self, name):
+        return LocalBucket(self.root, name)
+
+    @contextlib.contextmanager
+    def batch(self, raise_exception=True):
+        # Deletes inside a batch simply run one after another
+        yield self
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+class LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class LocalDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return LocalCollectionReference(self._client, f"{self.path}/{name}")
+
+    def _resolve(self, data):
+        return {k: (_now() if v is SERVER_TIMESTAMP else v) for k, v in data.items()}
+
+    def set(self, data, merge=False):
+        with self._client.lock:
+            current = self._client.docs.get(self.path) if merge else None
+            self._client.docs[self.path] = {**(current or {}), **self._resolve(data)}
+
+    def update(self, data):
+        with self._client.lock:
+            if self.path not in self._client.docs:
+                raise NotFound(f"No document to update: {self.path}")
+            self._client.docs[self.path].update(self._resolve(data))
+
+    def get(self):
+        with self._client.lock:
+            data = self._client.docs.get(self.path)
+            return LocalSnapshot(self, dict(data) if data is not None else None)
+
+    def delete(self):
+        with self._client.lock:
+            self._client.docs.pop(self.path, None)
+
+
+class LocalQuery:
+    OPS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "in": lambda a, b: a in b,
+    }
+
+    def __init__(self, collection, filters=(), max_results=None, order=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._limit = max_results
+        self._order = order
+
+    def where(self, field, op, value):
+        return LocalQuery(self._collection, self._filters + [(field, op, value)], self._limit, self._order)
+
+    def limit(self, count):
+        return LocalQuery(self._collection, self._filters, count, self._order)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return LocalQuery(self._collection, self._filters, self._limit, (field, direction == "DESCENDING"))
+
+    def stream(self):
+        results = [
+            snap for snap in self._collection._children()
+            if all(self.OPS[op](snap._data.get(field), value) for field, op, value in self._filters)
+        ]
+        if self._order:
+            field, descending = self._order
+            results.sort(key=lambda snap: snap._data.get(field), reverse=descending)
+        return list(itertools.islice(results, self._limit))
+
+
+class LocalCollectionReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, doc_id=None):
+        return LocalDocumentReference(self._client, f"{self.path}/{doc_id or uuid.uuid4().hex}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def _children(self):
+        prefix = f"{self.path}/"
+        with self._client.lock:
+            items = [
+                (path, dict(data)) for path, data in self._client.docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+        return [LocalSnapshot(LocalDocumentReference(self._client, path), data) for path, data in sorted(items)]
+
+    def stream(self):
+        return self._children()
+
+    def where(self, field, op, value):
+        return LocalQuery(self).where(field, op, value)
+
+    def limit(self, count):
+        return LocalQuery(self).limit(count)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return LocalQuery(self).order_by(field, direction)
+
+
+class LocalBulkWriter:
+    def __init__(self, client):
+        self._client = client
+        self._error_callback = None
+        self._is_open = True
+
+    def _check_open(self):
+        # Like the real BulkWriter, a closed writer rejects new operations
+        if not self._is_open:
+            raise Exception("BulkWriter is closed and cannot accept new operations")
+
+    def on_write_error(self, callback):
+        self._error_callback = callback
+
+    def delete(self, reference):
+        self._check_open()
+        reference.delete()
+
+    def set(self, reference, data, merge=False):
+        self._check_open()
+        reference.set(data, merge=merge)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._is_open = False
+
+
+class LocalFirestore:
+    """In-memory document store keyed by full document path."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.RLock()
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def bulk_writer(self):
+        return LocalBulkWriter(self)
+
+    def recursive_delete(self, reference, bulk_writer=None):
+        # The real client deletes through the writer and closes it when done
+        writer = bulk_writer or self.bulk_writer()
+        prefix = f"{reference.path}/"
+        with self.lock:
+            paths = [p for p in self.docs if p == reference.path or p.startswith(prefix)]
+        for path in paths:
+            writer.delete(LocalDocumentReference(self, path))
+        writer.close()
+        return len(paths)
+
+
+# ---------------------------------------------------------------------------
+# Vision OCR and Firebase auth
+# ---------------------------------------------------------------------------
+
+class _DoneOperation:
+    def result(self, timeout=None):
+        return None
+
+
+class LocalVisionClient:
+    """
+    Answers async_batch_annotate_files by reading each page's text layer with PyMuPDF and
+    writing Vision-format JSON shards to the requested output prefix. LOCAL_OCR_SECONDS_PER_PAGE
+    adds simulated recognition time.
+    """
+
+    def __init__(self, storage_client, seconds_per_page=0.0):
+        self.storage_client = storage_client
+        self.seconds_per_page = seconds_per_page
+
+    @staticmethod
+    def _split_uri(uri):
+        bucket_name, _, name = uri[len("gs://"):].partition("/")
+        return bucket_name, name
+
+    def async_batch_annotate_files(self, requests):
+        import fitz  # PyMuPDF
+
+        for request in requests:
+            src_bucket, src_name = self._split_uri(request.input_config.gcs_source.uri)
+            out_bucket, out_prefix = self._split_uri(request.output_config.gcs_destination.uri)
+            batch_size = request.output_config.batch_size or 20
+            data = self.storage_client.bucket(src_bucket).blob(src_name).download_as_bytes()
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                texts = [page.get_text("text") for page in doc]
+            time.sleep(self.seconds_per_page * len(texts))
+            output = self.storage_client.bucket(out_bucket)
+            for start in range(0, len(texts), batch_size):
+                end = min(start + batch_size, len(texts))
+                responses = [
+                    {"fullTextAnnotation": {"text": text}, "context": {"pageNumber": start + i + 1}}
+                    for i, text in enumerate(texts[start:end])
+                ]
+                output.blob(f"{out_prefix}output-{start + 1}-to-{end}.json").upload_from_string(
+                    json.dumps({"responses": responses})
+                )
+        return _DoneOperation()
+
+
+class LocalAuth:
+    class UserNotFoundError(Exception):
+        pass
+
+    def __init__(self):
+        self.deleted = set()
+
+    def delete_user(self, uid):
+        if uid in self.deleted:
+            raise self.UserNotFoundError(f"No user record found for {uid}")
+        self.deleted.add(uid)
+
+
+def create_clients(data_dir, ocr_seconds_per_page=0.0):
+    """Return (storage_client, firestore_client, vision_client, auth) stand-ins."""
+    storage_client = LocalStorageClient(os.path.join(data_dir, "storage"))
+    return (
+        storage_client,
+        LocalFirestore(),
+        LocalVisionClient(storage_client, ocr_seconds_per_page),
+        LocalAuth(),
+    )
@@ -1,24 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import firebase_admin
-from sentence_transformers import SentenceTransformer
-from google.cloud import storage, firestore
-from google.cloud import vision_v1
+from fastapi.responses import JSONResponse
 import faiss
-import fitz  # PyMuPDF
 import numpy as np
-import requests
 import os
+import asyncio
 import uuid
 import json
 import time
+import hashlib
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
+import tempfile
+from typing import List
 from docx import Document
 import openpyxl
 import xlrd
-from firebase_admin import auth
-from firebase_admin import credentials
+import threading
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from jobs import JobQueue, JobQueueFull
+from llm_client import DeepSeekClient, LLMError
+from index_cache import IndexCache
+from index_registry import IndexRegistry
+from shared_state import SharedState
+from collection_index import CollectionIndex, index_vectors
+from chunk_store import ChunkStoreWriter, is_chunk_store, convert_json_chunks
+from embedding_cache import EmbeddingCache, chunk_key
+from embedding_service import EmbeddingBatcher
+from answer_cache import AnswerCache, context_key, depends_on_history
+from history import COLLECTION_KEY, create_history_store, format_history
+import pdf_extract
+from index_factory import choose_index_spec, build_index
+from purge import PURGE_STAGES, purge_user, mark_purge, pending_purges, purge_in_progress
+import telemetry
+from telemetry import OCR_FALLBACKS, OCR_PAGES, STORAGE_BYTES, JOB_STAGE_SECONDS
+from ocr import create_ocr_backend, iter_ocr_merged
+from embedders import create_embedder
+from lazy import Lazy
 
 # Load environment variables
 load_dotenv()
@@ -34,200 +55,576 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Run each request under a trace id (X-Request-ID) and record its latency by route."""
+    trace_id = request.headers.get("X-Request-ID") or telemetry.new_trace_id()
+    with telemetry.trace(trace_id):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            route = request.scope.get("route")
+            telemetry.REQUEST_SECONDS.labels(
+                request.method, route.path if route else "unmatched", status
+            ).observe(time.perf_counter() - start)
+    response.headers["X-Request-ID"] = trace_id
+    return response
+
 # Environment variables
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 GCS_KEY_PATH = os.getenv("GCS_KEY_PATH")
 FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 2))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 64))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 3600))
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+INDEX_CACHE_TTL_SECONDS = int(os.getenv("INDEX_CACHE_TTL_SECONDS", 0))
+COLLECTION_CACHE_MAX_BYTES = int(os.getenv("COLLECTION_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Local directory holding the mmapped indexes and chunk stores of loaded files, shared by all workers on the host
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", os.path.join(tempfile.gettempdir(), "queryfile_chunks"))
+INDEX_STORE_MAX_BYTES = int(os.getenv("INDEX_STORE_MAX_BYTES", 8 * 1024 * 1024 * 1024))
+# Check the blob generations of a locally stored index before a worker opens it
+INDEX_STORE_VALIDATE = os.getenv("INDEX_STORE_VALIDATE", "true").lower() == "true"
+ARTIFACT_FETCH_WORKERS = int(os.getenv("ARTIFACT_FETCH_WORKERS", 8))
+# SQLite file with the state all workers share: active files, index versions and job status
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", os.path.join(tempfile.gettempdir(), "queryfile_state.sqlite"))
+JOB_PUBLISH_SECONDS = float(os.getenv("JOB_PUBLISH_SECONDS", 1))
+# Rewrite legacy .chunks.json artifacts as binary chunk stores the first time they are loaded
+MIGRATE_JSON_CHUNKS = os.getenv("MIGRATE_JSON_CHUNKS", "true").lower() == "true"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "torch" (sentence-transformers), "onnx" or "onnx-int8"; see embedders.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("onnx_models", EMBEDDING_MODEL))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "queryfile_embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 2_000_000))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 64))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 2))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+# Smaller PDFs are extracted in-process; the pool only pays off for long documents
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 48))
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", 200))
+# Word paragraphs shorter than this (headings, list items) are chunked with the paragraphs after them
+PARAGRAPH_MIN_WORDS = int(os.getenv("PARAGRAPH_MIN_WORDS", 40))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 256))
+PURGE_WORKERS = int(os.getenv("PURGE_WORKERS", 2))
+PURGE_PARALLELISM = int(os.getenv("PURGE_PARALLELISM", 8))
+# OCR for PDF pages without a text layer: "vision", "tesseract" (local) or "none"
+OCR_BACKEND = os.getenv("OCR_BACKEND", "vision")
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", 20))
+# Sparse pages are sent to OCR in windows of this many pages, this many windows at a time
+OCR_WINDOW_PAGES = int(os.getenv("OCR_WINDOW_PAGES", 20))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", 2))
+# Extracted pages held back waiting on OCR before extraction waits for it
+OCR_MAX_HELD_PAGES = int(os.getenv("OCR_MAX_HELD_PAGES", 100))
+OCR_TIMEOUT_SECONDS = int(os.getenv("OCR_TIMEOUT_SECONDS", 600))
+OCR_DOWNLOAD_WORKERS = int(os.getenv("OCR_DOWNLOAD_WORKERS", 8))
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Answers are reused for questions with the same retrieved context and at least this cosine similarity
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.92))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 10000))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+# Share cached answers between the workers on a host through the shared state file
+ANSWER_CACHE_SHARED = os.getenv("ANSWER_CACHE_SHARED", "true").lower() == "true"
+# Chat history per (uid, fileid): "sqlite" (shared by the workers on a host), "memory" or "firestore"
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", 20))
+HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", 10000))
+# Write turns to the file's chats documents; off because the frontend already stores them
+HISTORY_FIRESTORE_WRITE = os.getenv("HISTORY_FIRESTORE_WRITE", "false").lower() == "true"
+# Approximate prompt tokens spent on history; only the latest answer is kept at length
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 600))
+HISTORY_RECENT_ANSWER_TOKENS = int(os.getenv("HISTORY_RECENT_ANSWER_TOKENS", 200))
+HISTORY_OLDER_ANSWER_TOKENS = int(os.getenv("HISTORY_OLDER_ANSWER_TOKENS", 40))
+
+# "gcp" (default) or "local" for offline runs against local stand-ins (see local_backends.py)
+QUERYFILE_BACKEND = os.getenv("QUERYFILE_BACKEND", "gcp")
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", os.path.join(tempfile.gettempdir(), "queryfile_local"))
+LOCAL_OCR_SECONDS_PER_PAGE = float(os.getenv("LOCAL_OCR_SECONDS_PER_PAGE", 0))
+
+if QUERYFILE_BACKEND == "local":
+    BUCKET_NAME = BUCKET_NAME or "local-bucket"
+
+# Clients and the embedding model are created on first use (or by the warm-up thread started
+# at startup), so the process answers /health as soon as it is imported; /ready reports when
+# everything has been initialized.
+def create_clients():
+    """Return (storage_client, firestore_client, vision_client, auth) for QUERYFILE_BACKEND."""
+    if QUERYFILE_BACKEND == "local":
+        import local_backends
+        print(f"Using local backends in {LOCAL_DATA_DIR}")
+        return local_backends.create_clients(LOCAL_DATA_DIR, LOCAL_OCR_SECONDS_PER_PAGE)
 
-# Set GCS credentials
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GCS_KEY_PATH
+    import firebase_admin
+    from firebase_admin import auth, credentials
+    from google.cloud import firestore, storage, vision_v1
 
-# Initialize Firebase
-cred = credentials.Certificate(GCS_KEY_PATH)
-firebase_admin.initialize_app(cred, {
-    "storageBucket": FIREBASE_STORAGE_BUCKET
-})
+    # Set GCS credentials
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GCS_KEY_PATH
 
-storage_client = storage.Client()
-bucket = storage_client.bucket(BUCKET_NAME)
-firestore_client = firestore.Client()
-vision_client = vision_v1.ImageAnnotatorClient()
+    # Initialize Firebase
+    cred = credentials.Certificate(GCS_KEY_PATH)
+    firebase_admin.initialize_app(cred, {
+        "storageBucket": FIREBASE_STORAGE_BUCKET
+    })
+    return storage.Client(), firestore.Client(), vision_v1.ImageAnnotatorClient(), auth
 
-# Use CPU for embedding (no GPU needed)
-device = "cpu"
-print(f"Using device: {device}")
+def server_timestamp():
+    if QUERYFILE_BACKEND == "local":
+        import local_backends
+        return local_backends.SERVER_TIMESTAMP
+    from google.cloud import firestore
+    return firestore.SERVER_TIMESTAMP
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2", device=device)
-print("Warming up embedder...")
-embedder.encode(["Warm-up query"], convert_to_numpy=True)
-print("Embedder warmed up.")
+clients = Lazy("cloud clients", create_clients)
+storage_client = Lazy("storage client", lambda: clients.get()[0])
+firestore_client = Lazy("firestore client", lambda: clients.get()[1])
+vision_client = Lazy("vision client", lambda: clients.get()[2])
+auth = Lazy("firebase auth", lambda: clients.get()[3])
+bucket = Lazy("bucket", lambda: storage_client.bucket(BUCKET_NAME))
 
-# Chat history for context-awareness
-chat_history = {}
-active_indices = {}
-active_chunks_dict = {}
+ocr_backend = None if OCR_BACKEND == "none" else Lazy("OCR backend", lambda: create_ocr_backend(
+    OCR_BACKEND,
+    vision_client,
+    bucket,
+    download_workers=OCR_DOWNLOAD_WORKERS,
+    timeout=OCR_TIMEOUT_SECONDS,
+    on_transfer=lambda direction, nbytes: STORAGE_BYTES.labels(direction=direction).inc(nbytes),
+    dpi=OCR_DPI,
+    lang=OCR_LANG,
+))
+
+# Embeddings run on the CPU (no GPU needed)
+embedder = Lazy(f"{EMBEDDING_BACKEND} embedder", lambda: create_embedder(
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+))
+# Cached chunk embeddings are only reused by the backend that computed them
+EMBEDDING_CACHE_MODEL = EMBEDDING_MODEL if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL}:{EMBEDDING_BACKEND}"
+
+# All query and ingestion encodes go through one batcher so concurrent requests share forward passes
+embedding_service = EmbeddingBatcher(
+    lambda texts: embedder.encode(texts),
+    max_batch_size=EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=EMBED_BATCH_WAIT_MS,
+    cache_size=QUERY_EMBEDDING_CACHE_SIZE,
+)
+
+# Which file each user has selected, per-user cache versions and job status, shared by all
+# uvicorn workers so any of them can serve any request
+shared_state = SharedState(SHARED_STATE_PATH)
+# Indexes and chunk stores are mapped read-only from one copy on local disk per host
+index_registry = IndexRegistry(CHUNK_STORE_DIR, max_bytes=INDEX_STORE_MAX_BYTES)
+
+# This worker's opened indexes; entries are tagged with the user's version (bumped on purge) when opened
+index_cache = IndexCache(max_bytes=INDEX_CACHE_MAX_BYTES, ttl=INDEX_CACHE_TTL_SECONDS)
+# In-flight loads by (uid, fileid), so concurrent requests for a file share one load
+index_loads = {}
+# Blob downloads and metadata checks for index artifacts run side by side on this pool
+artifact_pool = ThreadPoolExecutor(max_workers=ARTIFACT_FETCH_WORKERS, thread_name_prefix="artifact")
+# Per-user CollectionIndex over all of a user's files, keyed by (uid, None). The index is
+# published to the registry under COLLECTION_ENTRY and mapped, like per-file indexes
+COLLECTION_ENTRY = "_collection"
+collection_cache = IndexCache(max_bytes=COLLECTION_CACHE_MAX_BYTES, ttl=INDEX_CACHE_TTL_SECONDS)
+# In-flight collection builds by uid, so concurrent collection queries share one build
+collection_builds = {}
+telemetry.register_caches({"file": index_cache, "collection": collection_cache})
+
+# Chunk embeddings survive restarts so re-uploads and revised documents only embed new chunks
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+
+# Chat history for context-awareness, per user and file
+history_store = create_history_store(
+    HISTORY_BACKEND,
+    HISTORY_MAX_TURNS,
+    path=SHARED_STATE_PATH,
+    max_conversations=HISTORY_MAX_CONVERSATIONS,
+    firestore_client=firestore_client,
+    write=HISTORY_FIRESTORE_WRITE,
+)
+
+# DeepSeek answers for repeated questions about the same retrieved context
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL_SECONDS, threshold=ANSWER_CACHE_SIMILARITY,
+    shared=shared_state if ANSWER_CACHE_SHARED else None,
+)
+
+def publish_job(job):
+    shared_state.put_job(job.to_dict())
+
+# Ingestion runs on a bounded worker pool so uploads never block the event loop
+ingest_queue = JobQueue(
+    max_workers=INGEST_WORKERS, max_pending=INGEST_QUEUE_SIZE, ttl=JOB_TTL_SECONDS,
+    on_stage=telemetry.observe_job_stage, on_update=publish_job,
+)
+# Account/data purges get their own small pool so they never hold up uploads
+purge_queue = JobQueue(
+    max_workers=PURGE_WORKERS, max_pending=INGEST_QUEUE_SIZE, ttl=JOB_TTL_SECONDS,
+    on_stage=telemetry.observe_job_stage, on_update=publish_job,
+)
+
+# Pooled async client for DeepSeek completions, shared by /query and /query/stream
+llm_client = DeepSeekClient(
+    DEEPSEEK_API_URL,
+    DEEPSEEK_API_KEY,
+    timeout=LLM_TIMEOUT_SECONDS,
+    connect_timeout=LLM_CONNECT_TIMEOUT_SECONDS,
+    max_retries=LLM_MAX_RETRIES,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_connections=LLM_MAX_CONNECTIONS,
+)
 
 def generate_uid():
     return str(uuid.uuid4())
 
+def gcs_path_from_url(url):
+    prefix = f"https://storage.googleapis.com/{BUCKET_NAME}/"
+    if not url or not url.startswith(prefix):
+        raise HTTPException(status_code=400, detail="Invalid URL format")
+    return url[len(prefix):]
+
+def hash_file(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            sha.update(block)
+    return sha.hexdigest()
+
 def upload_to_gcs(source_file, destination_blob_name):
+    """Upload a file and return the generation of the new blob."""
     try:
         blob = bucket.blob(destination_blob_name)
         blob.upload_from_filename(source_file)
+        STORAGE_BYTES.labels(direction="upload").inc(os.path.getsize(source_file))
         print(f"File {source_file} uploaded to gs://{BUCKET_NAME}/{destination_blob_name}")
+        return blob.generation
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload to GCS: {str(e)}")
 
-def extract_text_from_pdf(file_path):
+pdf_pool = None
+
+def get_pdf_pool():
+    global pdf_pool
+    if pdf_pool is None:
+        # Spawned workers import only pdf_extract, not this module and its clients/model
+        pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return pdf_pool
+
+def iter_pdf_page_texts(file_path, page_count):
+    """
+    Yield (page_number, text) in page order. Long documents are split into page ranges
+    extracted in parallel on the process pool, with a bounded number of ranges in flight
+    so memory stays proportional to the window rather than the document.
+    """
+    if page_count < PDF_PARALLEL_MIN_PAGES:
+        yield from pdf_extract.extract_page_range(file_path, 0, page_count)
+        return
+
+    pool = get_pdf_pool()
+    ranges = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    in_flight = []
+    for start in ranges:
+        in_flight.append(pool.submit(pdf_extract.extract_page_range, file_path, start, start + PDF_PAGES_PER_TASK))
+        if len(in_flight) >= PDF_EXTRACT_WORKERS * 2:
+            break
+    while in_flight:
+        pages = in_flight.pop(0).result()
+        next_start = next(ranges, None)
+        if next_start is not None:
+            in_flight.append(pool.submit(pdf_extract.extract_page_range, file_path, next_start, next_start + PDF_PAGES_PER_TASK))
+        yield from pages
+
+def iter_pdf_pages(file_path, job_item=None):
+    """
+    Stream (text, page_number) segments of a PDF in page order as pages are extracted.
+    Pages whose text layer has fewer than OCR_MIN_PAGE_CHARS characters are sent to the OCR
+    backend in windows as they turn up, and later pages wait only for the OCR before them.
+    """
     try:
-        doc = fitz.open(file_path)
-        text = ""
+        page_count = pdf_extract.page_count(file_path)
         total_chars = 0
-        page_count = len(doc)
-        
-        # Extract text with PyMuPDF
-        for page in doc:
-            page_text = page.get_text("text")
-            text += page_text
-            total_chars += len(page_text.strip())
-        
-        doc.close()
-        
-        # If little text extracted (<100 chars/page), assume image-based PDF and use Cloud Vision API
-        if page_count > 0 and total_chars / page_count < 100:
-            print(f"Low text content detected ({total_chars} chars in {page_count} pages). Using Cloud Vision API for OCR.")
-            # Upload PDF to GCS temporarily for Vision API
-            temp_gcs_path = f"temp/{os.path.basename(file_path)}"
-            upload_to_gcs(file_path, temp_gcs_path)
-            
-            # Call Vision API
-            gcs_source = vision_v1.GcsSource(uri=f"gs://{BUCKET_NAME}/{temp_gcs_path}")
-            input_config = vision_v1.InputConfig(gcs_source=gcs_source, mime_type="application/pdf")
-            feature = vision_v1.Feature(type_=vision_v1.Feature.Type.DOCUMENT_TEXT_DETECTION)
-            request = vision_v1.AsyncAnnotateFileRequest(
-                features=[feature],
-                input_config=input_config,
-                output_config=vision_v1.OutputConfig(
-                    gcs_destination=vision_v1.GcsDestination(uri=f"gs://{BUCKET_NAME}/temp/output/"),
-                    batch_size=10  # Process up to 10 pages per output file
-                )
+        ocr_used = False
+
+        def extracted():
+            for page_number, page_text in iter_pdf_page_texts(file_path, page_count):
+                if job_item is not None:
+                    job_item.stage_progress("extract", page_number / page_count)
+                yield page_number, page_text
+
+        def run_ocr(pages):
+            nonlocal ocr_used
+            if not ocr_used:
+                ocr_used = True
+                OCR_FALLBACKS.inc()
+            print(f"Running {OCR_BACKEND} OCR on {len(pages)} pages without a usable text layer ({pages[0]}-{pages[-1]} of {page_count}).")
+            OCR_PAGES.inc(len(pages))
+            with telemetry.span("ingest.ocr", pages=len(pages)):
+                return ocr_backend.ocr_pages(file_path, pages)
+
+        pages = extracted()
+        if ocr_backend is not None:
+            pages = iter_ocr_merged(
+                pages, run_ocr, lambda text: len(text.strip()) < OCR_MIN_PAGE_CHARS,
+                window_pages=OCR_WINDOW_PAGES, max_held_pages=OCR_MAX_HELD_PAGES, workers=OCR_CONCURRENCY,
             )
-            
-            operation = vision_client.async_batch_annotate_files(requests=[request])
-            operation.result(timeout=600)  # Wait up to 10 minutes for larger PDFs
-            
-            # Retrieve all output files from GCS
-            ocr_text = ""
-            output_blobs = list(bucket.list_blobs(prefix="temp/output/"))
-            print(f"Found {len(output_blobs)} output files for OCR processing.")
-            for output_blob in output_blobs:
-                output_json = output_blob.download_as_string().decode("utf-8")
-                responses = json.loads(output_json)
-                for response in responses.get("responses", []):
-                    if "fullTextAnnotation" in response:
-                        ocr_text += response["fullTextAnnotation"]["text"] + "\n"
-                # Clean up each output blob
-                bucket.delete_blob(output_blob.name)
-            
-            # Clean up temporary input file
-            bucket.delete_blob(temp_gcs_path)
-            
-            text = ocr_text if ocr_text.strip() else text  # Fallback to PyMuPDF text if OCR fails
-        
-        if not text.strip():
-            raise ValueError("No extractable text found in the PDF.")
-        print(f"Extracted {len(text)} characters from {page_count} pages.")
-        return text
+        for page_number, page_text in pages:
+            total_chars += len(page_text.strip())
+            yield page_text, page_number
+        print(f"Extracted {total_chars} characters from {page_count} pages.")
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error extracting PDF: {str(e)}")
 
-def extract_text_from_docx(file_path):
+def iter_docx_chunks(file_path, words_per_chunk=CHUNK_WORDS):
+    """
+    Stream (chunk, None) pairs from a Word document: paragraphs are chunked by words and
+    each table becomes row groups that repeat the table's header row.
+    """
     try:
         doc = Document(file_path)
-        text = ""
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + "\t"
-                text += "\n"
-        if not text.strip():
+        found = False
+        paragraphs = iter_paragraph_segments(para.text for para in doc.paragraphs if para.text.strip())
+        for chunk in iter_word_chunks(paragraphs, words_per_chunk):
+            found = True
+            yield chunk
+        for number, table in enumerate(doc.tables, 1):
+            rows = (
+                cells for row in table.rows
+                if (cells := [cell.text.strip() for cell in row.cells if cell.text.strip()])
+            )
+            for chunk in iter_row_groups(f"Table {number}", rows, words_per_chunk):
+                found = True
+                yield chunk
+        if not found:
             raise ValueError("No extractable text found in the Word document.")
-        return text
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error extracting Word document: {str(e)}")
 
-def extract_text_from_excel(file_path, extension):
-    try:
-        text = ""
-        if extension == ".xlsx":
-            wb = openpyxl.load_workbook(file_path, read_only=True)
+def iter_paragraph_segments(paragraphs, min_words=PARAGRAPH_MIN_WORDS):
+    """
+    Turn paragraph texts into (text, None) segments for iter_word_chunks. Paragraphs shorter
+    than min_words are joined to the paragraphs after them, so a heading stays with its text;
+    whether a paragraph is joined only depends on its own length.
+    """
+    pending = []
+    for text in paragraphs:
+        pending.append(text)
+        if len(text.split()) >= min_words:
+            yield "\n".join(pending), None
+            pending = []
+    if pending:
+        yield "\n".join(pending), None
+
+def format_cell(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def iter_excel_sheets(file_path, extension):
+    """
+    Yield (sheet_name, rows) for each sheet, where rows lazily yields the non-empty cell
+    texts of each non-empty row. Only one sheet is held in memory at a time.
+    """
+    if extension == ".xlsx":
+        wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
             for sheet in wb:
-                for row in sheet.rows:
-                    for cell in row:
-                        if cell.value:
-                            text += str(cell.value) + "\t"
-                    text += "\n"
+                # Drop the stored dimensions so only cells that exist are visited, instead of
+                # padding every row to a (possibly bogus) max_column
+                sheet.reset_dimensions()
+                yield sheet.title, (
+                    cells for row in sheet.iter_rows(values_only=True)
+                    if (cells := [format_cell(v) for v in row if v is not None and str(v).strip()])
+                )
+        finally:
             wb.close()
-        elif extension == ".xls":
-            wb = xlrd.open_workbook(file_path)
-            for sheet in wb.sheets():
-                for row_idx in range(sheet.nrows):
-                    for col_idx in range(sheet.ncols):
-                        cell_value = sheet.cell_value(row_idx, col_idx)
-                        if cell_value:
-                            text += str(cell_value) + "\t"
-                    text += "\n"
-        
-        if not text.strip():
+    elif extension == ".xls":
+        wb = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            for sheet_index in range(wb.nsheets):
+                sheet = wb.sheet_by_index(sheet_index)
+                if sheet.nrows:
+                    yield sheet.name, (
+                        cells for row_idx in range(sheet.nrows)
+                        if (cells := [
+                            format_cell(v)
+                            for v, t in zip(sheet.row_values(row_idx), sheet.row_types(row_idx))
+                            if t not in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK) and str(v).strip()
+                        ])
+                    )
+                wb.unload_sheet(sheet_index)
+        finally:
+            wb.release_resources()
+
+def iter_row_groups(title, rows, words_per_chunk=CHUNK_WORDS):
+    """
+    Group rows (lists of cell texts) into (chunk, None) pairs of about words_per_chunk words.
+    The first row is taken as the header and repeated, with the title, at the top of every
+    chunk so a chunk retrieved on its own still says what its columns are.
+    """
+    header = None
+    group = []
+    group_words = 0
+    for cells in rows:
+        line = "\t".join(cells)
+        if header is None:
+            header = f"{title}\n{line}"
+            continue
+        words = len(line.split())
+        if group and group_words + words > words_per_chunk:
+            yield header + "\n" + "\n".join(group), None
+            group = []
+            group_words = 0
+        group.append(line)
+        group_words += words
+    if group:
+        yield header + "\n" + "\n".join(group), None
+    elif header is not None:
+        yield header, None
+
+def iter_excel_chunks(file_path, extension, words_per_chunk=CHUNK_WORDS):
+    """Stream (chunk, None) row groups from every sheet of an Excel workbook."""
+    try:
+        found = False
+        for sheet_name, rows in iter_excel_sheets(file_path, extension):
+            for chunk in iter_row_groups(f"Sheet: {sheet_name}", rows, words_per_chunk):
+                found = True
+                yield chunk
+        if not found:
             raise ValueError("No extractable text found in the Excel file.")
-        return text
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error extracting Excel file: {str(e)}")
 
 async def save_pdf_locally(upload_file: UploadFile):
-    temp_path = f"./{upload_file.filename}"
+    # Unique prefix so concurrent uploads of the same filename don't overwrite each other
+    temp_path = f"./{uuid.uuid4().hex}_{os.path.basename(upload_file.filename)}"
     with open(temp_path, "wb") as f:
         while chunk := await upload_file.read(4096):
             f.write(chunk)
     return temp_path
 
-def process_pdf_and_store_index(text, uid, pdf_name):
-    try:
+def encode_chunks(chunks):
+    """
+    Embed chunks, reusing cached embeddings for any chunk text seen before.
+    """
+    keys = [chunk_key(EMBEDDING_CACHE_MODEL, chunk) for chunk in chunks]
+    cached = embedding_cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    print(f"Embedding cache: {len(chunks) - len(missing)} of {len(chunks)} chunks cached")
+    if missing:
+        new_embeddings = embedding_service.encode([chunks[i] for i in missing])
+        embedding_cache.put_many((keys[i], vector) for i, vector in zip(missing, new_embeddings))
+        for i, vector in zip(missing, new_embeddings):
+            cached[keys[i]] = vector
+    return np.vstack([cached[key] for key in keys]).astype("float32")
+
+def start_stage(job_item, stage):
+    if job_item is not None:
+        job_item.start_stage(stage)
+
+def stage_progress(job_item, stage, fraction=None, count=None):
+    if job_item is not None:
+        job_item.stage_progress(stage, fraction, count)
+
+def iter_word_chunks(segments, words_per_chunk=CHUNK_WORDS):
+    """
+    Turn a stream of (text, page) segments (PDF pages, Word paragraphs) into (chunk, page)
+    pairs of at most words_per_chunk words. Every segment starts a new chunk and is split
+    into windows of equal size, so an edit only changes the chunks of its own segment and
+    the rest of the document keeps its embedding cache keys.
+    """
+    for text, page in segments:
         words = text.split()
-        pdf_chunks = [" ".join(words[i:i + 200]) for i in range(0, len(words), 200)]
-        if not pdf_chunks:
-            raise Exception("No text extracted from file")
-
-        embeddings = embedder.encode(pdf_chunks, convert_to_numpy=True)
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings)
-
-        index_file = f"{pdf_name}.index"
-        faiss.write_index(index, index_file)
-        index_gcs_path = f"{uid}/index/{index_file}"
-        upload_to_gcs(index_file, index_gcs_path)
-        os.remove(index_file)
-        print(f"FAISS index uploaded and deleted locally: {index_gcs_path}")
-
-        chunks_file = f"{pdf_name}.chunks.json"
-        with open(chunks_file, "w") as f:
-            json.dump(pdf_chunks, f)
-        chunks_gcs_path = f"{uid}/chunks/{chunks_file}"
-        upload_to_gcs(chunks_file, chunks_gcs_path)
-        os.remove(chunks_file)
-        print(f"Chunks uploaded and deleted locally: {chunks_gcs_path}")
-
-        return index_gcs_path, chunks_gcs_path
+        if not words:
+            continue
+        windows = -(-len(words) // words_per_chunk)
+        size = -(-len(words) // windows)
+        for start in range(0, len(words), size):
+            yield " ".join(words[start:start + size]), page
+
+def process_pdf_and_store_index(chunks, uid, content_hash, job_item=None):
+    """
+    Embed a stream of (chunk, page) pairs in fixed-size batches and add them to the index as
+    they arrive, writing chunks straight to a local chunk store.
+    Artifacts are stored under the content hash, so uploads that share a name never overwrite
+    each other's index. Returns the GCS paths, the index spec, the local index and chunk store files and the
+    uploaded blobs as registry sources.
+    """
+    work_id = uuid.uuid4().hex
+    local_chunks_file = os.path.join(CHUNK_STORE_DIR, f"{work_id}.chunks.tmp")
+    local_index_file = os.path.join(CHUNK_STORE_DIR, f"{work_id}.index.tmp")
+    try:
+        index = None
+        batch = []
+        chunk_count = 0
+
+        def flush(index):
+            embeddings = encode_chunks(batch)
+            if index is None:
+                index = faiss.IndexFlatL2(embeddings.shape[1])
+            index.add(embeddings)
+            stage_progress(job_item, "embed", count=chunk_count)
+            stage_progress(job_item, "index", count=index.ntotal)
+            return index
+
+        with ChunkStoreWriter(local_chunks_file) as writer:
+            for chunk, page in chunks:
+                writer.add(chunk, page)
+                batch.append(chunk)
+                chunk_count += 1
+                stage_progress(job_item, "chunk", count=chunk_count)
+                if len(batch) >= INGEST_EMBED_BATCH:
+                    index = flush(index)
+                    batch = []
+            if batch:
+                index = flush(index)
+        if index is None:
+            raise HTTPException(status_code=400, detail="No extractable text found in the file.")
+
+        # Vectors are streamed into a flat index; large documents are rebuilt as HNSW / IVF-PQ
+        index_spec = choose_index_spec(index.ntotal, index.d)
+        if index_spec["type"] != "flat":
+            stage_progress(job_item, "index", count=index.ntotal)
+            index = build_index(index_vectors(index), index_spec)
+            print(f"Built {index_spec['type']} index over {index.ntotal} vectors: {index_spec['params']}")
+
+        start_stage(job_item, "persist")
+        faiss.write_index(index, local_index_file)
+        index_gcs_path = f"{uid}/index/{content_hash}.index"
+        index_generation = upload_to_gcs(local_index_file, index_gcs_path)
+        print(f"FAISS index uploaded: {index_gcs_path}")
+
+        chunks_gcs_path = f"{uid}/chunks/{content_hash}.chunks.bin"
+        chunks_generation = upload_to_gcs(local_chunks_file, chunks_gcs_path)
+        print(f"Chunks uploaded: {chunks_gcs_path}")
+
+        sources = {"index": [index_gcs_path, index_generation], "chunks": [chunks_gcs_path, chunks_generation]}
+        return index_gcs_path, chunks_gcs_path, index_spec, local_index_file, local_chunks_file, sources
     except Exception as e:
+        for path in (local_chunks_file, local_index_file):
+            if os.path.exists(path):
+                os.remove(path)
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
-def save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_path):
+def save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_path, content_hash=None, index_spec=None):
     try:
         fileid = str(uuid.uuid4())
         file_data = {
@@ -235,7 +632,10 @@ def save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_p
             "pdfUrl": f"https://storage.googleapis.com/{BUCKET_NAME}/{pdf_gcs_path}",
             "indexUrl": f"https://storage.googleapis.com/{BUCKET_NAME}/{index_gcs_path}",
             "chunksUrl": f"https://storage.googleapis.com/{BUCKET_NAME}/{chunks_gcs_path}",
-            "upload_date": firestore.SERVER_TIMESTAMP,
+            "contentHash": content_hash,
+            "indexType": (index_spec or {}).get("type", "flat"),
+            "indexParams": (index_spec or {}).get("params", {}),
+            "upload_date": server_timestamp(),
         }
         doc_ref = firestore_client.collection("users").document(uid).collection("files").document(fileid)
         doc_ref.set(file_data)
@@ -244,115 +644,505 @@ def save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_p
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving metadata to Firestore: {str(e)}")
 
-@app.post("/upload_pdf")
-async def upload_pdf(file: UploadFile = File(...), uid: str = Form(None)):
-    try:
-        if not uid:
-            uid = generate_uid()
-        pdf_name = file.filename
-        extension = os.path.splitext(pdf_name)[1].lower()
+def file_index_spec(file_data):
+    """Index spec recorded in file metadata; files uploaded before index selection are flat."""
+    return {"type": file_data.get("indexType", "flat"), "params": file_data.get("indexParams") or {}}
+
+def find_file_by_hash(uid, content_hash):
+    """Return (fileid, metadata) of the user's file with identical content, if any."""
+    files_ref = firestore_client.collection("users").document(uid).collection("files")
+    for file_doc in files_ref.where("contentHash", "==", content_hash).limit(1).stream():
+        return file_doc.id, file_doc.to_dict()
+    return None, None
 
-        # Validate file extension
-        if extension not in [".pdf", ".docx", ".xlsx", ".xls"]:
-            raise HTTPException(status_code=400, detail="Invalid file type. Only PDF, Word (.docx), and Excel (.xlsx, .xls) are supported.")
+def reuse_existing_file(uid, pdf_name, content_hash, existing_id, existing):
+    """
+    Point a re-uploaded file at the artifacts of an identical earlier upload instead of
+    extracting and embedding it again. Same filename and content returns the existing file.
+    """
+    if existing.get("filename") == pdf_name:
+        return existing_id
+    return save_file_metadata(
+        uid,
+        pdf_name,
+        gcs_path_from_url(existing["pdfUrl"]),
+        gcs_path_from_url(existing["indexUrl"]),
+        gcs_path_from_url(existing["chunksUrl"]),
+        content_hash,
+        file_index_spec(existing),
+    )
 
-        file_local_path = await save_pdf_locally(file)
-        pdf_gcs_path = f"{uid}/pdf/{pdf_name}"
-        upload_to_gcs(file_local_path, pdf_gcs_path)
+SUPPORTED_EXTENSIONS = [".pdf", ".docx", ".xlsx", ".xls"]
 
-        # Extract text based on file type
+def ingest_file(job_item, uid, pdf_name, extension, file_local_path):
+    """
+    Run the full ingestion pipeline for one saved upload. Called on the ingestion worker pool.
+    """
+    try:
+        start_stage(job_item, "extract")
+        content_hash = hash_file(file_local_path)
+        # A running purge deletes the artifacts an identical earlier upload points at, so
+        # the file is ingested from scratch until the purge has finished
+        existing_id, existing = None, None
+        if not purge_in_progress(firestore_client, uid):
+            existing_id, existing = find_file_by_hash(uid, content_hash)
+        if existing_id:
+            fileid = reuse_existing_file(uid, pdf_name, content_hash, existing_id, existing)
+            print(f"Upload {pdf_name} matches file {existing_id}; reusing its index and chunks")
+            if fileid != existing_id:
+                # A new file entry: the user's collection has to include it
+                shared_state.file_added(uid)
+            return {"id": fileid, "filename": pdf_name, "deduplicated": True}
+
+        # Extract text based on file type; every extractor streams its chunks into the index
         if extension == ".pdf":
-            text = extract_text_from_pdf(file_local_path)
+            chunks = iter_word_chunks(iter_pdf_pages(file_local_path, job_item))
         elif extension == ".docx":
-            text = extract_text_from_docx(file_local_path)
+            chunks = iter_docx_chunks(file_local_path)
         elif extension in [".xlsx", ".xls"]:
-            text = extract_text_from_excel(file_local_path, extension)
+            chunks = iter_excel_chunks(file_local_path, extension)
+
+        index_gcs_path, chunks_gcs_path, index_spec, local_index_file, local_chunks_file, sources = process_pdf_and_store_index(chunks, uid, content_hash, job_item)
+        try:
+            pdf_gcs_path = f"{uid}/pdf/{content_hash}/{pdf_name}"
+            upload_to_gcs(file_local_path, pdf_gcs_path)
+            fileid = save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_path, content_hash, index_spec)
+        except Exception:
+            os.remove(local_index_file)
+            os.remove(local_chunks_file)
+            raise
 
-        index_gcs_path, chunks_gcs_path = process_pdf_and_store_index(text, uid, pdf_name)
-        fileid = save_file_metadata(uid, pdf_name, pdf_gcs_path, index_gcs_path, chunks_gcs_path)
+        # The uploader usually opens the file right away, so keep the fresh index warm on this host.
+        # The file is already stored, so a failure here only means it is loaded from GCS later.
+        version = shared_state.version(uid)
+        shared_state.file_added(uid)
+        try:
+            index_registry.publish(uid, fileid, local_index_file, local_chunks_file, index_spec, sources)
+            index, chunks, index_nbytes, chunks_path = index_registry.open(uid, fileid)
+            index_cache.put((uid, fileid), index, chunks, index_nbytes, path=chunks_path, version=version)
+        except Exception as e:
+            print(f"Error keeping the index of file {fileid} warm: {str(e)}")
+            for path in (local_index_file, local_chunks_file):
+                if os.path.exists(path):
+                    os.remove(path)
+        return {"id": fileid, "filename": pdf_name, "deduplicated": False}
+    finally:
+        if os.path.exists(file_local_path):
+            os.remove(file_local_path)
+
+@app.post("/upload_pdf")
+async def upload_pdf(
+    file: UploadFile = File(None),
+    files: List[UploadFile] = File(None),
+    uid: str = Form(None),
+):
+    """
+    Queue one or more files for ingestion and return the job id immediately.
+    Progress is reported by /jobs/{job_id}.
+    """
+    try:
+        if not uid:
+            uid = generate_uid()
+        uploads = ([file] if file else []) + (files or [])
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No file provided.")
+
+        # Validate file extensions
+        for upload in uploads:
+            extension = os.path.splitext(upload.filename)[1].lower()
+            if extension not in SUPPORTED_EXTENSIONS:
+                raise HTTPException(status_code=400, detail="Invalid file type. Only PDF, Word (.docx), and Excel (.xlsx, .xls) are supported.")
+
+        saved = []
+        with telemetry.span("ingest.receive", JOB_STAGE_SECONDS.labels(kind="ingest", stage="receive", status="done")):
+            for upload in uploads:
+                extension = os.path.splitext(upload.filename)[1].lower()
+                saved.append((upload.filename, extension, await save_pdf_locally(upload)))
+
+        items = [
+            (pdf_name, lambda item, n=pdf_name, e=extension, p=path: ingest_file(item, uid, n, e, p))
+            for pdf_name, extension, path in saved
+        ]
+        try:
+            job = ingest_queue.submit("ingest", uid, items, trace_id=telemetry.current_trace_id())
+        except JobQueueFull as e:
+            for _, _, path in saved:
+                os.remove(path)
+            raise HTTPException(status_code=503, detail=str(e))
 
-        os.remove(file_local_path)
         return {
-            "message": "File uploaded and processed successfully",
+            "message": "File upload accepted for processing",
             "uid": uid,
-            "id": fileid,
-            "filename": pdf_name,
+            "job_id": job.id,
+            "filenames": [upload.filename for upload in uploads],
         }
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = ingest_queue.get(job_id) or purge_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # Submitted on another worker; its progress is published to the shared state
+    snapshot = shared_state.get_job(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return snapshot
+
+def load_file_index(uid, fileid):
+    """
+    Map a file's FAISS index and chunks from the index registry into the index cache,
+    downloading them from GCS first if no worker on this host has loaded the file yet.
+    """
+    version = shared_state.version(uid)
+    # A second attempt covers the entry being pruned between the download and the open
+    for _ in range(2):
+        if not is_stored_current(uid, fileid):
+            with index_registry.lock(uid, fileid):
+                # Another worker may have downloaded it while we waited for the lock
+                if not is_stored_current(uid, fileid):
+                    fetch_file_index(uid, fileid)
+        opened = index_registry.open(uid, fileid)
+        if opened is not None:
+            break
+    else:
+        raise HTTPException(status_code=500, detail="Index was removed from local storage while loading")
+    index, chunks, index_nbytes, chunks_path = opened
+    print(f"Index and chunks for file {fileid} mapped for user {uid}")
+    return index_cache.put((uid, fileid), index, chunks, index_nbytes, path=chunks_path, version=version)
+
+def blob_generation(path):
+    blob = bucket.get_blob(path)
+    return blob.generation if blob is not None else None
+
+def is_stored_current(uid, fileid):
+    """
+    Whether the index registry holds the file and, with INDEX_STORE_VALIDATE, its blobs still
+    have the generations it was copied from (only metadata is fetched for the check).
+    """
+    meta = index_registry.meta(uid, fileid)
+    if meta is None:
+        return False
+    sources = meta.get("sources")
+    if not INDEX_STORE_VALIDATE:
+        return True
+    if not sources:
+        return False
+    generations = list(artifact_pool.map(blob_generation, [path for path, _ in sources.values()]))
+    return generations == [generation for _, generation in sources.values()]
+
+def download_artifact(path, local_file):
+    """Download a blob to local_file and return its generation; a missing blob is a 404."""
+    blob = bucket.get_blob(path)
+    if blob is None:
+        raise HTTPException(status_code=404, detail=f"File artifact {path} not found")
+    # The blob carries its generation, so the download is of exactly that version
+    blob.download_to_filename(local_file)
+    STORAGE_BYTES.labels(direction="download").inc(os.path.getsize(local_file))
+    return blob.generation
+
+def fetch_file_index(uid, fileid):
+    """Download a file's FAISS index and chunks from GCS and publish them to the index registry."""
+    doc_ref = firestore_client.collection("users").document(uid).collection("files").document(fileid)
+    doc = doc_ref.get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="File metadata not found")
+    data = doc.to_dict()
+    index_path = gcs_path_from_url(data.get("indexUrl"))
+    chunks_path = gcs_path_from_url(data.get("chunksUrl"))
+
+    # Both files stay on local disk and are mmapped, so only the pages a query touches are
+    # ever read in. They are downloaded side by side into the registry's directory and
+    # moved in once complete, without being read back.
+    work_id = uuid.uuid4().hex
+    local_index_file = os.path.join(CHUNK_STORE_DIR, f"{work_id}.index.tmp")
+    local_chunks_file = os.path.join(CHUNK_STORE_DIR, f"{work_id}.chunks.tmp")
+    try:
+        downloads = [
+            artifact_pool.submit(download_artifact, index_path, local_index_file),
+            artifact_pool.submit(download_artifact, chunks_path, local_chunks_file),
+        ]
+        # Let both finish before a failure is raised, so neither is still writing during cleanup
+        wait_futures(downloads)
+        index_generation, chunks_generation = [download.result() for download in downloads]
+        sources = {"index": [index_path, index_generation], "chunks": [chunks_path, chunks_generation]}
+        if not is_chunk_store(local_chunks_file):
+            migrated_path = migrate_chunks_artifact(doc_ref, chunks_path, local_chunks_file)
+            # Without migration the converted copy is still checked against the JSON blob
+            if migrated_path:
+                sources["chunks"] = [migrated_path, blob_generation(migrated_path)]
+        index_registry.publish(uid, fileid, local_index_file, local_chunks_file, file_index_spec(data), sources)
+        print(f"Index and chunks for file {fileid} downloaded for user {uid}")
+    finally:
+        for path in (local_index_file, local_chunks_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+def migrate_chunks_artifact(doc_ref, chunks_path, local_file):
+    """
+    Convert a downloaded legacy .chunks.json file to a chunk store in place and, if enabled,
+    upload the converted artifact and point the file metadata at it. Returns the new blob path.
+    """
+    json_file = f"{local_file}.json"
+    os.replace(local_file, json_file)
+    try:
+        count = convert_json_chunks(json_file, local_file)
+    finally:
+        os.remove(json_file)
+    if not MIGRATE_JSON_CHUNKS:
+        return None
+    base = chunks_path[:-len(".json")] if chunks_path.endswith(".json") else chunks_path
+    migrated_path = f"{base}.bin"
+    upload_to_gcs(local_file, migrated_path)
+    doc_ref.update({"chunksUrl": f"https://storage.googleapis.com/{BUCKET_NAME}/{migrated_path}"})
+    bucket.delete_blob(chunks_path)
+    print(f"Migrated {count} chunks from {chunks_path} to {migrated_path}")
+    return migrated_path
+
+async def get_file_index(uid, fileid):
+    """
+    Return the cache entry for (uid, fileid), reopening it if it was evicted or the user's
+    files were purged since it was opened (possibly through another worker). Concurrent
+    calls for the same file wait on a single load.
+    """
+    key = (uid, fileid)
+    entry = index_cache.get(key)
+    if entry is not None and entry.version == shared_state.version(uid):
+        return entry
+
+    load = index_loads.get(key)
+    if load is None:
+        load = asyncio.ensure_future(run_file_index_load(uid, fileid))
+        index_loads[key] = load
+        load.add_done_callback(lambda done: index_loads.pop(key) if index_loads.get(key) is done else None)
+    # Shielded so a client that disconnects does not cancel the load for the others
+    return await asyncio.shield(load)
+
+async def run_file_index_load(uid, fileid):
+    with telemetry.span("index.load", fileid=fileid):
+        return await asyncio.to_thread(load_file_index, uid, fileid)
+
+def list_user_fileids(uid):
+    files_ref = firestore_client.collection("users").document(uid).collection("files")
+    return [file_doc.id for file_doc in files_ref.stream()]
+
+async def get_collection(uid):
+    """
+    Return the cache entry of the user's CollectionIndex, mapping it from the registry on
+    first use and whenever the user's files changed. Concurrent calls for the same user
+    wait on a single build.
+    """
+    version = shared_state.files_version(uid)
+    entry = collection_cache.get((uid, None))
+    if entry is not None and entry.version == version:
+        return entry
+
+    build = collection_builds.get(uid)
+    if build is None:
+        build = asyncio.ensure_future(run_collection_build(uid, version))
+        collection_builds[uid] = build
+        build.add_done_callback(lambda done: collection_builds.pop(uid) if collection_builds.get(uid) is done else None)
+    # Shielded so a client that disconnects does not cancel the build for the others
+    return await asyncio.shield(build)
+
+async def run_collection_build(uid, version):
+    with telemetry.span("collection.build"):
+        fileids = await asyncio.to_thread(list_user_fileids, uid)
+        file_entries = await asyncio.gather(*(get_file_index(uid, fileid) for fileid in fileids))
+        if not file_entries:
+            raise HTTPException(status_code=400, detail="No files uploaded yet.")
+        # Updating and training an IVF collection take seconds for large users
+        return await asyncio.to_thread(build_collection, uid, version, fileids, file_entries)
+
+def build_collection(uid, version, fileids, file_entries):
+    """
+    Map the user's collection from the registry, first bringing the published one up to date
+    with fileids if it does not cover exactly those files. One worker per host does the
+    update under the registry lock; the others then map its result, so the host keeps one
+    copy of the collection's vectors instead of one per worker.
+    """
+    chunks = {fileid: file_entry.chunks for fileid, file_entry in zip(fileids, file_entries)}
+    with index_registry.lock(uid, COLLECTION_ENTRY):
+        meta = index_registry.meta(uid, COLLECTION_ENTRY)
+        updated = None
+        if meta is None or set(meta["slots"]) != set(fileids):
+            updated = update_collection(uid, version, fileids, file_entries, meta)
+        opened = index_registry.open_index(uid, COLLECTION_ENTRY)
+    if opened is not None:
+        index, meta, _ = opened
+        collection = CollectionIndex.restore(index, meta["spec"], meta, chunks)
+    elif updated is not None:
+        # Pruned right after publishing: serve this worker's own copy until the next change
+        collection = updated
+    else:
+        raise RuntimeError(f"Collection index of user {uid} was removed while being opened")
+    return collection_cache.put((uid, None), collection, [], collection.nbytes(), version=version)
+
+def update_collection(uid, version, fileids, file_entries, meta):
+    """
+    Publish a collection over fileids. The published collection is updated incrementally,
+    only adding and removing the files that changed, unless the collection has grown or
+    shrunk into a different index spec; then it is rebuilt and trained from scratch.
+    Returns the collection in memory.
+    """
+    dimension = file_entries[0].index.d
+    spec = choose_index_spec(sum(e.index.ntotal for e in file_entries), dimension, removable=True)
+    collection = None
+    if meta is not None and meta["spec"] == spec:
+        index_path, _, _ = index_registry.paths(uid, COLLECTION_ENTRY)
+        try:
+            # Read into memory: the published file stays untouched for workers that map it
+            previous = faiss.read_index(index_path)
+        except RuntimeError:
+            previous = None
+        if previous is not None:
+            collection = CollectionIndex.restore(
+                previous, spec, meta, {fileid: [] for fileid in meta["slots"]}, mapped=False
+            )
+            for fileid in set(meta["slots"]) - set(fileids):
+                collection.remove_file(fileid)
+    if collection is None:
+        vectors = np.vstack([index_vectors(file_entry.index) for file_entry in file_entries])
+        collection = CollectionIndex(dimension, spec, vectors)
+        del vectors
+    for fileid, file_entry in zip(fileids, file_entries):
+        if fileid in collection:
+            collection.chunks[fileid] = file_entry.chunks
+        else:
+            collection.add_file(fileid, index_vectors(file_entry.index), file_entry.chunks)
+
+    fd, local_index_file = tempfile.mkstemp(suffix=".index", dir=CHUNK_STORE_DIR)
+    os.close(fd)
+    try:
+        state = collection.write(local_index_file)
+        index_registry.publish(uid, COLLECTION_ENTRY, local_index_file, None, spec,
+                               extra={**state, "files_version": version})
+    finally:
+        if os.path.exists(local_index_file):
+            os.remove(local_index_file)
+    print(f"Collection index ({spec['type']}) published for user {uid} with {len(collection.slots)} files")
+    return collection
+
 @app.post("/load_index")
 async def load_index(uid: str = Form(...), fileid: str = Form(...)):
     try:
-        doc_ref = firestore_client.collection("users").document(uid).collection("files").document(fileid)
-        doc = doc_ref.get()
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="File metadata not found")
-        data = doc.to_dict()
-        index_url = data.get("indexUrl")
-        chunks_url = data.get("chunksUrl")
-
-        prefix = f"https://storage.googleapis.com/{BUCKET_NAME}/"
-        if not (index_url.startswith(prefix) and chunks_url.startswith(prefix)):
-            raise HTTPException(status_code=400, detail="Invalid URL format")
-        index_path = index_url[len(prefix):]
-        chunks_path = chunks_url[len(prefix):]
-
-        local_index_file = f"./temp_index_{uid}.index"
-        blob = bucket.blob(index_path)
-        blob.download_to_filename(local_index_file)
-        active_indices[uid] = faiss.read_index(local_index_file)
-        os.remove(local_index_file)
-        print(f"Index for file {fileid} loaded for user {uid}")
-
-        local_chunks_file = f"./temp_chunks_{uid}.json"
-        blob = bucket.blob(chunks_path)
-        blob.download_to_filename(local_chunks_file)
-        with open(local_chunks_file, "r") as f:
-            active_chunks_dict[uid] = json.load(f)
-        os.remove(local_chunks_file)
-        print(f"Chunks for file {fileid} loaded for user {uid}")
-
+        await get_file_index(uid, fileid)
+        shared_state.set_active(uid, fileid)
         return {"message": "Index and chunks loaded successfully"}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading index and chunks: {str(e)}")
 
-@app.post("/query")
-async def query_pdf(query: str = Form(...), uid: str = Form(...)):
-    try:
-        if uid not in active_indices or active_indices[uid] is None:
-            raise HTTPException(status_code=400, detail="No FAISS index loaded. Please select a file first.")
-        if uid not in active_chunks_dict or not active_chunks_dict[uid]:
-            raise HTTPException(status_code=400, detail="No chunks loaded. Please select a file first.")
+@app.get("/metrics")
+async def metrics():
+    body, content_type = telemetry.render_metrics()
+    return Response(content=body, media_type=content_type)
 
-        index = active_indices[uid]
-        chunks = active_chunks_dict[uid]
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        **index_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "embedding_batches": embedding_service.stats(),
+        "answers": answer_cache.stats(),
+        "registry": index_registry.stats(),
+    }
 
-        start_time = time.time()
+SYSTEM_PROMPT = "You are a helpful PDF chatbot. Provide clear, organized answers with bullet points for lists, proper punctuation, and a friendly tone."
 
-        t1 = time.time()
-        query_embedding = embedder.encode([query], convert_to_numpy=True)
-        print(f"Embedding time: {time.time() - t1:.2f}s")
+async def get_active_index(uid, fileid):
+    if not fileid:
+        raise HTTPException(status_code=400, detail="No FAISS index loaded. Please select a file first.")
+    entry = await get_file_index(uid, fileid)
+    if not entry.chunks:
+        raise HTTPException(status_code=400, detail="No chunks loaded. Please select a file first.")
+    return entry
 
-        t2 = time.time()
-        distances, indices = index.search(query_embedding, k=3)
-        print(f"FAISS search time: {time.time() - t2:.2f}s")
+async def get_search_target(uid, fileid=None, fileids=None):
+    """
+    Resolve what a query searches: the user's collection (fileids="all" or a comma-separated
+    list of file ids) or a single file's index (fileid, or the file selected with /load_index).
+    Returns a search(query_embedding, k) function yielding (fileid, chunk_idx, chunk_text) and
+    the key of the conversation the query belongs to.
+    """
+    if fileids:
+        collection_entry = await get_collection(uid)
+        collection = collection_entry.index
+        selected = None if fileids == "all" else [f.strip() for f in fileids.split(",") if f.strip()]
+        # The mapped collection is read-only: selected files it does not cover yet are
+        # searched on their own indexes and merged by distance
+        missing = [f for f in selected or [] if f not in collection]
+        missing_entries = [await get_file_index(uid, f) for f in missing]
 
-        t3 = time.time()
-        context = "\n".join([chunks[idx] for idx in indices[0] if idx < len(chunks)])
-        print(f"Context building time: {time.time() - t3:.2f}s")
+        def search(query_embedding, k):
+            results = collection.search(query_embedding, k, selected)
+            for missing_fileid, file_entry in zip(missing, missing_entries):
+                distances, indices = file_entry.index.search(query_embedding, k=k)
+                results += [
+                    (missing_fileid, int(idx), file_entry.chunks[idx], float(distance))
+                    for distance, idx in zip(distances[0], indices[0]) if 0 <= idx < len(file_entry.chunks)
+                ]
+            results.sort(key=lambda r: r[3])
+            return [r[:3] for r in results[:k]]
+        return search, COLLECTION_KEY
 
-        # Add chat history for context-awareness
-        if uid not in chat_history:
-            chat_history[uid] = []
-        history_str = "\n".join([f"User: {q}\nAssistant: {r}" for q, r in chat_history[uid][-5:]])
+    target_fileid = fileid or shared_state.get_active(uid)
+    entry = await get_active_index(uid, target_fileid)
 
-        t4 = time.time()
-        prompt = f"""You are a helpful PDF chatbot. Provide clear, organized answers with bullet points for lists, proper punctuation, and a friendly tone.
+    def search(query_embedding, k):
+        distances, indices = entry.index.search(query_embedding, k=k)
+        return [(target_fileid, int(idx), entry.chunks[idx]) for idx in indices[0] if 0 <= idx < len(entry.chunks)]
+    return search, target_fileid
+
+async def prepare_query(query, uid, fileid=None, fileids=None):
+    """
+    Embed the query through the shared embedding service, retrieve context and build the
+    DeepSeek payload. Returns the payload, the (fileid, chunk) sources used, the answer
+    cache lookup for the question and the conversation the answer is recorded under.
+    """
+    with telemetry.query_stage("resolve"):
+        search, conversation = await get_search_target(uid, fileid, fileids)
+
+    with telemetry.query_stage("embed"):
+        query_embedding = await embedding_service.encode_query_async(query)
+
+    with telemetry.query_stage("history"):
+        turns = await asyncio.to_thread(history_store.turns, uid, conversation)
+
+    # The search, the answer cache lookup (SQLite when shared) and prompt building run off the event loop
+    payload, sources, cached = await asyncio.to_thread(build_query_payload, query, uid, search, query_embedding, turns)
+    return payload, sources, cached, conversation
+
+def build_query_payload(query, uid, search, query_embedding, turns=()):
+    """
+    Retrieve context for the embedded query with the given search function and build the DeepSeek
+    payload, with as much of the conversation's earlier (question, answer) turns as the history
+    budget allows. Returns the payload, the (fileid, chunk) sources the context came from and the
+    answer cache lookup.
+    """
+    with telemetry.query_stage("search"):
+        results = search(query_embedding, 3)
+
+    with telemetry.query_stage("context"):
+        context = "\n".join([text for _, _, text in results])
+        sources = [{"fileid": fileid, "chunk": chunk_idx} for fileid, chunk_idx, _ in results]
+
+    with telemetry.query_stage("answer_cache"):
+        if turns and depends_on_history(query):
+            cached = answer_cache.skip(uid, context_key(results), query, query_embedding)
+        else:
+            cached = answer_cache.lookup(uid, context_key(results), query, query_embedding)
+
+    with telemetry.query_stage("prompt"):
+        # Add chat history for context-awareness
+        history_str = format_history(
+            list(turns), HISTORY_TOKEN_BUDGET, HISTORY_RECENT_ANSWER_TOKENS, HISTORY_OLDER_ANSWER_TOKENS
+        )
+        prompt = f"""{SYSTEM_PROMPT}
 
 **Chat History:**
 {history_str}
@@ -362,79 +1152,162 @@ async def query_pdf(query: str = Form(...), uid: str = Form(...)):
 
 **Question:**
 {query}"""
-        print(f"Prompt building time: {time.time() - t4:.2f}s")
-
-        # Call DeepSeek API
-        t5 = time.time()
-        headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "You are a helpful PDF chatbot. Provide clear, organized answers with bullet points for lists, proper punctuation, and a friendly tone."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 400,
-            "temperature": 0.7,
-            "top_p": 0.9
-        }
-        response = requests.post("https://api.deepseek.com/v1/chat/completions", json=payload, headers=headers)
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"DeepSeek API error: {response.text}")
-        output_text = response.json()["choices"][0]["message"]["content"]
-        print(f"DeepSeek API call time: {time.time() - t5:.2f}s")
-
-        t6 = time.time()
-        chat_history[uid].append((query, output_text))
-        print(f"Post-processing time: {time.time() - t6:.2f}s")
-
-        total_time = time.time() - start_time
-        print(f"Total query time: {total_time:.2f}s")
+
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 400,
+        "temperature": 0.7,
+        "top_p": 0.9
+    }
+    return payload, sources, cached
+
+@app.post("/query")
+async def query_pdf(
+    query: str = Form(...),
+    uid: str = Form(...),
+    fileid: str = Form(None),
+    fileids: str = Form(None),
+):
+    try:
+        with telemetry.query_stage("total"):
+            payload, sources, cached, conversation = await prepare_query(query, uid, fileid, fileids)
+
+            if cached.answer is not None:
+                output_text = cached.answer
+                print(f"Answer cache hit (similarity {cached.similarity:.3f})")
+            else:
+                # Call DeepSeek API
+                with telemetry.query_stage("llm"):
+                    try:
+                        output_text = await llm_client.complete(payload)
+                    except LLMError as e:
+                        raise HTTPException(status_code=500, detail=str(e))
+                await asyncio.to_thread(cached.store, output_text)
+
+            await asyncio.to_thread(history_store.append, uid, conversation, query, output_text)
+
         print(f"User: {uid}")
         print(f"Query: {query}")
         print(f"Output: {output_text}")
 
-        return {"response": output_text}
+        return {"response": output_text, "sources": sources, "cached": cached.answer is not None}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying file: {str(e)}")
+
+def sse_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_pdf_stream(
+    query: str = Form(...),
+    uid: str = Form(...),
+    fileid: str = Form(None),
+    fileids: str = Form(None),
+):
+    """
+    Same as /query, but forwards answer tokens as server-sent events while DeepSeek generates them.
+    Events are {"token": ...} followed by a final {"done": true, "response": ...} or {"error": ...}.
+    """
+    try:
+        start_time = time.perf_counter()
+        payload, sources, cached, conversation = await prepare_query(query, uid, fileid, fileids)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying file: {str(e)}")
+
+    # Captured up front so the spans recorded while streaming carry the request's trace id
+    trace_id = telemetry.current_trace_id()
+
+    async def event_stream():
+        if cached.answer is not None:
+            # A cached answer is sent whole as a single token event
+            await asyncio.to_thread(history_store.append, uid, conversation, query, cached.answer)
+            telemetry.QUERY_STAGE_SECONDS.labels(stage="first_token").observe(time.perf_counter() - start_time)
+            yield sse_event({"token": cached.answer})
+            yield sse_event({"done": True, "response": cached.answer, "sources": sources, "cached": True})
+            return
+
+        parts = []
+        first_token_time = None
+        try:
+            async for token in llm_client.stream(payload):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    telemetry.QUERY_STAGE_SECONDS.labels(stage="first_token").observe(first_token_time - start_time)
+                parts.append(token)
+                yield sse_event({"token": token})
+        except LLMError as e:
+            yield sse_event({"error": str(e)})
+            return
+        output_text = "".join(parts)
+        await asyncio.to_thread(history_store.append, uid, conversation, query, output_text)
+        await asyncio.to_thread(cached.store, output_text)
+        total_time = time.perf_counter() - start_time
+        telemetry.QUERY_STAGE_SECONDS.labels(stage="stream_total").observe(total_time)
+        telemetry.record_span("query.stream_total", total_time, trace_id=trace_id, tokens=len(parts))
+        yield sse_event({"done": True, "response": output_text, "sources": sources, "cached": False})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
     
+def delete_firebase_user(uid):
+    try:
+        auth.delete_user(uid)
+    except auth.UserNotFoundError:
+        # Already deleted by an earlier run of a resumed purge
+        pass
+
+def start_purge(uid, mode, started=None):
+    """
+    Drop the user's in-memory state and queue a background purge of their stored data.
+    mode is "data" (files and chats) or "account" (also the Firebase user). Blocks on
+    SQLite, local disk and Firestore, so endpoints run it in a thread.
+    """
+    index_cache.drop_user(uid)
+    collection_cache.drop_user(uid)
+    answer_cache.invalidate_user(uid)
+    # Both modes delete the user's chats
+    history_store.drop_user(uid)
+    # Other workers see the new versions and drop their cached indexes for the user
+    shared_state.purged(uid)
+    index_registry.drop_user(uid)
+
+    if started is None:
+        started = datetime.datetime.now(datetime.timezone.utc)
+        mark_purge(firestore_client, uid, mode, started)
+    delete_account = delete_firebase_user if mode == "account" else None
+    return purge_queue.submit("purge", uid, [(
+        uid,
+        lambda item: purge_user(storage_client, bucket, firestore_client, uid, started, delete_account, PURGE_PARALLELISM, item),
+    )], stages=PURGE_STAGES, trace_id=telemetry.current_trace_id())
+
 @app.post("/clear_data")
 async def clear_data(request: UIDRequest):
     """
     Delete all files from GCS bucket and Firestore for the given user, keeping the user's folder.
+    The deletion runs in the background; progress is reported by /jobs/{job_id}.
     """
     uid = request.uid
     try:
         # Validate UID
         if not uid:
             raise HTTPException(status_code=400, detail="User ID is required.")
-
-        # Delete files from GCS bucket (contents only)
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blobs = bucket.list_blobs(prefix=f"{uid}/")
-        blob_count = 0
-        for blob in blobs:
-            blob.delete()
-            blob_count += 1
-        print(f"Deleted {blob_count} files for user {uid} from GCS.")
-
-        # Delete Firestore data
-        user_ref = firestore_client.collection("users").document(uid)
-        files_ref = user_ref.collection("files")
-        file_count = 0
-        chat_count = 0
-        for file_doc in files_ref.stream():
-            chats_ref = file_doc.reference.collection("chats")
-            for chat_doc in chats_ref.stream():
-                chat_doc.reference.delete()
-                chat_count += 1
-            file_doc.reference.delete()
-            file_count += 1
-        user_ref.delete()
-        print(f"Deleted {file_count} files and {chat_count} chats for user {uid} from Firestore.")
-
-        return {"message": "All user data cleared successfully."}
+        job = await asyncio.to_thread(start_purge, uid, "data")
+        return {"message": "All user data is being cleared.", "job_id": job.id}
+    except HTTPException as e:
+        raise e
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error clearing data for user {uid}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -443,46 +1316,99 @@ async def clear_data(request: UIDRequest):
 async def delete_account(request: UIDRequest):
     """
     Delete all user data (GCS, including the user's folder, and Firestore) and the Firebase user account.
+    The deletion runs in the background; progress is reported by /jobs/{job_id}.
     """
     uid = request.uid
     try:
         # Validate UID
         if not uid:
             raise HTTPException(status_code=400, detail="User ID is required.")
-
-        # Delete all GCS data, including the user's folder
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blobs = bucket.list_blobs(prefix=f"{uid}/")
-        blob_count = 0
-        for blob in blobs:
-            blob.delete()
-            blob_count += 1
-        print(f"Deleted {blob_count} files and the folder for user {uid} from GCS.")
-
-        # Clear Firestore data
-        user_ref = firestore_client.collection("users").document(uid)
-        files_ref = user_ref.collection("files")
-        file_count = 0
-        chat_count = 0
-        for file_doc in files_ref.stream():
-            chats_ref = file_doc.reference.collection("chats")
-            for chat_doc in chats_ref.stream():
-                chat_doc.reference.delete()
-                chat_count += 1
-            file_doc.reference.delete()
-            file_count += 1
-        user_ref.delete()
-        print(f"Deleted {file_count} files and {chat_count} chats for user {uid} from Firestore.")
-
-        # Delete Firebase user
-        auth.delete_user(uid)
-        print(f"Deleted Firebase user {uid}.")
-
-        return {"message": "Account, folder, and all associated data deleted successfully."}
+        job = await asyncio.to_thread(start_purge, uid, "account")
+        return {"message": "Account, folder, and all associated data are being deleted.", "job_id": job.id}
+    except HTTPException as e:
+        raise e
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error deleting account for user {uid}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def resume_purges():
+    # Purges interrupted by a restart (or that had failures) are idempotent; run them again.
+    # Every worker warms up at startup, but only the first one resumes them.
+    if not shared_state.claim("resume_purges", ttl=600):
+        return
+    try:
+        for uid, mode, started in pending_purges(firestore_client):
+            print(f"Resuming {mode} purge for user {uid}")
+            start_purge(uid, mode, started)
+    except Exception as e:
+        print(f"Error resuming purges: {str(e)}")
+
+warmup = {"done": False, "error": None}
+
+def warm_up():
+    """Initialize the clients and the embedder and run one encode, off the event loop."""
+    try:
+        bucket.get()
+        print("Warming up embedder...")
+        embedding_service.encode(["Warm-up query"])
+        print("Embedder warmed up.")
+        resume_purges()
+        warmup["done"] = True
+    except Exception as e:
+        warmup["error"] = str(e)
+        print(f"Error during warm-up: {str(e)}")
+
+def publish_jobs():
+    """Copy the progress of this worker's running jobs to the shared state so /jobs works on any worker."""
+    last_prune = 0
+    while True:
+        time.sleep(JOB_PUBLISH_SECONDS)
+        try:
+            for job in ingest_queue.unfinished() + purge_queue.unfinished():
+                publish_job(job)
+            if time.time() - last_prune > 60:
+                shared_state.prune_jobs(JOB_TTL_SECONDS)
+                if answer_cache.shared is not None:
+                    shared_state.prune_answers(ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES)
+                last_prune = time.time()
+        except Exception as e:
+            print(f"Error publishing jobs: {str(e)}")
+
+@app.on_event("startup")
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    threading.Thread(target=publish_jobs, name="job-publisher", daemon=True).start()
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: clients and the embedding model are initialized and warmed up."""
+    components = {
+        "clients": clients.initialized,
+        "embedder": embedder.initialized,
+        "warmed_up": warmup["done"],
+    }
+    errors = {name: lazy.error for name, lazy in [("clients", clients), ("embedder", embedder)] if lazy.error}
+    if warmup["error"]:
+        errors["warm_up"] = warmup["error"]
+    body = {"ready": all(components.values()), "components": components, "errors": errors}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    ingest_queue.shutdown()
+    purge_queue.shutdown()
+    artifact_pool.shutdown(wait=False, cancel_futures=True)
+    if pdf_pool is not None:
+        pdf_pool.shutdown(wait=False, cancel_futures=True)
+    await llm_client.close()
+
 if __name__ == "__main__":
     import uvicorn
     import signal
@@ -0,0 +1,207 @@
+"""
+OCR backends for PDF pages without a usable text layer.
+
+Both backends take the PDF and the 1-based page numbers to recognize and return
+{page: text}, so only scanned pages pay for OCR in mixed documents.
+
+    VisionOCR     Cloud Vision async batch annotation. The selected pages are copied into a
+                  smaller PDF under a per-job prefix, so concurrent jobs never see each
+                  other's input or output, and the output shards are downloaded in parallel.
+    TesseractOCR  Local tesseract through pytesseract, for offline runs and development.
+                  Optional: needs `pip install -r requirements-ocr.txt` and the tesseract
+                  binary (e.g. apt-get install tesseract-ocr).
+
+iter_ocr_merged sends the sparse pages of a stream of extracted pages to a backend in
+windows as they appear and merges the results back in page order.
+"""
+import collections
+import contextvars
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+
+def write_page_subset(file_path, pages, out_path):
+    """Write the given 1-based pages of file_path, in order, to a new PDF."""
+    with fitz.open(file_path) as doc:
+        doc.select([p - 1 for p in pages])
+        doc.save(out_path, garbage=3, deflate=True)
+
+
+class VisionOCR:
+    # Pages per output shard written by Vision
+    SHARD_PAGES = 10
+
+    def __init__(self, vision_client, bucket, download_workers=8, timeout=600, on_transfer=None):
+        from google.cloud import vision_v1
+
+        self.vision = vision_v1
+        self.client = vision_client
+        self.bucket = bucket
+        self.download_workers = download_workers
+        self.timeout = timeout
+        # on_transfer(direction, nbytes) is called for every upload and download
+        self.on_transfer = on_transfer
+
+    def _transferred(self, direction, nbytes):
+        if self.on_transfer is not None:
+            self.on_transfer(direction, nbytes)
+
+    def _download_shard(self, blob):
+        data = blob.download_as_bytes()
+        self._transferred("download", len(data))
+        return json.loads(data.decode("utf-8"))
+
+    def ocr_pages(self, file_path, pages):
+        if not pages:
+            return {}
+        prefix = f"temp/ocr/{uuid.uuid4().hex}/"
+        input_path = f"{prefix}input.pdf"
+        output_prefix = f"{prefix}output/"
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                subset = os.path.join(work_dir, "pages.pdf")
+                write_page_subset(file_path, pages, subset)
+                self.bucket.blob(input_path).upload_from_filename(subset)
+                self._transferred("upload", os.path.getsize(subset))
+
+            vision = self.vision
+            request = vision.AsyncAnnotateFileRequest(
+                features=[vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)],
+                input_config=vision.InputConfig(
+                    gcs_source=vision.GcsSource(uri=f"gs://{self.bucket.name}/{input_path}"),
+                    mime_type="application/pdf",
+                ),
+                output_config=vision.OutputConfig(
+                    gcs_destination=vision.GcsDestination(uri=f"gs://{self.bucket.name}/{output_prefix}"),
+                    batch_size=self.SHARD_PAGES,
+                ),
+            )
+            operation = self.client.async_batch_annotate_files(requests=[request])
+            operation.result(timeout=self.timeout)
+
+            shards = list(self.bucket.list_blobs(prefix=output_prefix))
+            texts = {}
+            with ThreadPoolExecutor(max_workers=max(1, min(self.download_workers, len(shards)))) as pool:
+                for output in pool.map(self._download_shard, shards):
+                    for response in output.get("responses", []):
+                        # pageNumber refers to the subset PDF; map it back to the original page
+                        subset_page = response.get("context", {}).get("pageNumber")
+                        if subset_page and "fullTextAnnotation" in response:
+                            texts[pages[subset_page - 1]] = response["fullTextAnnotation"]["text"]
+            return texts
+        finally:
+            for blob in list(self.bucket.list_blobs(prefix=prefix)):
+                try:
+                    blob.delete()
+                except Exception as e:
+                    print(f"Error deleting OCR artifact {blob.name}: {str(e)}")
+
+
+class TesseractOCR:
+    def __init__(self, dpi=300, lang="eng", workers=None):
+        try:
+            import pytesseract
+        except ImportError as e:
+            raise RuntimeError("OCR_BACKEND=tesseract needs the pytesseract package and the tesseract binary") from e
+        self.pytesseract = pytesseract
+        self.dpi = dpi
+        self.lang = lang
+        self.workers = workers or os.cpu_count() or 2
+
+    def _ocr_image(self, png):
+        from io import BytesIO
+
+        from PIL import Image
+
+        return self.pytesseract.image_to_string(Image.open(BytesIO(png)), lang=self.lang)
+
+    def ocr_pages(self, file_path, pages):
+        if not pages:
+            return {}
+        # Pages are rendered here, one window at a time so memory stays bounded, and
+        # recognized on threads; tesseract runs as a subprocess, so they run in parallel
+        texts = {}
+        with fitz.open(file_path) as doc, ThreadPoolExecutor(max_workers=min(self.workers, len(pages))) as pool:
+            in_flight = []
+            for page in pages:
+                png = doc[page - 1].get_pixmap(dpi=self.dpi).tobytes("png")
+                in_flight.append((page, pool.submit(self._ocr_image, png)))
+                if len(in_flight) >= self.workers * 2:
+                    done_page, future = in_flight.pop(0)
+                    texts[done_page] = future.result()
+            for done_page, future in in_flight:
+                texts[done_page] = future.result()
+        return texts
+
+
+def iter_ocr_merged(pages, ocr_pages, is_sparse, window_pages=20, max_held_pages=100, workers=2):
+    """
+    Yield the (page_number, text) pairs of pages in the same order, with the text of pages
+    for which is_sparse(text) holds replaced by ocr_pages(page_numbers) -> {page: text}.
+    Sparse pages are sent in windows of window_pages as they appear, on up to workers
+    threads, so OCR overlaps extraction. A page is yielded once the OCR of every sparse page
+    before it has returned; when more than max_held_pages are held back, the oldest window
+    is sent early and waited for.
+    """
+    held = collections.deque()  # [page_number, text, sparse, future]
+    window = []
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+
+    def submit():
+        # Run in the caller's context so telemetry spans nest under the ingestion job
+        future = pool.submit(contextvars.copy_context().run, ocr_pages, [entry[0] for entry in window])
+        for entry in window:
+            entry[3] = future
+        window.clear()
+
+    def release(keep):
+        while held:
+            entry = held[0]
+            page_number, text, sparse, _ = entry
+            if sparse:
+                wait = len(held) > keep
+                if entry[3] is None:
+                    if not wait:
+                        return
+                    submit()
+                if not (wait or entry[3].done()):
+                    return
+                text = entry[3].result().get(page_number) or text
+            held.popleft()
+            yield page_number, text
+
+    try:
+        for page_number, text in pages:
+            entry = [page_number, text, is_sparse(text), None]
+            held.append(entry)
+            if entry[2]:
+                window.append(entry)
+                if len(window) >= window_pages:
+                    submit()
+            yield from release(max_held_pages)
+        if window:
+            submit()
+        yield from release(0)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_ocr_backend(name, vision_client=None, bucket=None, **options):
+    """Build the OCR backend selected by OCR_BACKEND: "vision", "tesseract" or "none"."""
+    if name == "vision":
+        return VisionOCR(
+            vision_client, bucket,
+            download_workers=options.get("download_workers", 8),
+            timeout=options.get("timeout", 600),
+            on_transfer=options.get("on_transfer"),
+        )
+    if name == "tesseract":
+        return TesseractOCR(dpi=options.get("dpi", 300), lang=options.get("lang", "eng"), workers=options.get("workers"))
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown OCR backend {name}")
@@ -0,0 +1,17 @@
+"""
+PDF text extraction helpers run inside worker processes.
+
+Kept free of the application's imports so spawned pool workers only load PyMuPDF.
+"""
+import fitz  # PyMuPDF
+
+
+def page_count(file_path):
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def extract_page_range(file_path, start, end):
+    """Return [(page_number, text)] for pages start..end-1, numbered from 1."""
+    with fitz.open(file_path) as doc:
+        return [(i + 1, doc[i].get_text("text")) for i in range(start, min(end, len(doc)))]
@@ -0,0 +1,192 @@
+"""
+Bulk deletion of a user's data, shared by /clear_data and /delete_account.
+
+GCS blobs are deleted in batch requests of up to GCS_BATCH_SIZE deletes, several batches
+at a time; Firestore file documents and their chats are removed with recursive deletes,
+each through its own BulkWriter. Everything is idempotent, so a purge that was interrupted is
+resumed by running it again: a marker document in the "purges" collection records purges
+that have not finished yet.
+
+Only data created before the purge started is removed, so files uploaded while a purge is
+still running in the background survive it. The functions take the clients as arguments
+and only use a small part of their API, so local fakes or the emulators can stand in.
+"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from google.api_core import exceptions as gcs_exceptions
+
+GCS_BATCH_SIZE = 100
+PURGE_STAGES = ["storage", "firestore", "account"]
+PURGES_COLLECTION = "purges"
+
+
+def _created_before(value, cutoff):
+    return cutoff is None or value is None or value < cutoff
+
+
+def _delete_blob_batch(storage_client, bucket, names):
+    """Delete up to GCS_BATCH_SIZE blobs in one batch request; returns the names that failed."""
+    try:
+        with storage_client.batch():
+            for name in names:
+                bucket.delete_blob(name)
+        return []
+    except Exception:
+        # The batch reports only its first error; retry one by one to find what actually failed
+        failed = []
+        for name in names:
+            try:
+                bucket.delete_blob(name)
+            except gcs_exceptions.NotFound:
+                pass
+            except Exception as e:
+                failed.append({"name": name, "error": str(e)})
+        return failed
+
+
+def delete_blobs(storage_client, bucket, prefix, created_before=None, parallelism=8, on_progress=None):
+    """
+    Delete every blob under prefix (created before created_before, if given) using batched
+    deletes with bounded parallelism. Returns (deleted_count, failures).
+    """
+    deleted = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        futures = {}
+        names = []
+
+        def submit(batch):
+            futures[pool.submit(_delete_blob_batch, storage_client, bucket, batch)] = len(batch)
+
+        for blob in bucket.list_blobs(prefix=prefix):
+            if not _created_before(getattr(blob, "time_created", None), created_before):
+                continue
+            names.append(blob.name)
+            if len(names) == GCS_BATCH_SIZE:
+                submit(names)
+                names = []
+        if names:
+            submit(names)
+
+        for future in as_completed(futures):
+            failed = future.result()
+            deleted += futures[future] - len(failed)
+            failures.extend(failed)
+            if on_progress is not None:
+                on_progress(deleted, len(failures))
+    return deleted, failures
+
+
+def delete_user_documents(firestore_client, uid, created_before=None, delete_user_doc=True, on_progress=None):
+    """
+    Recursively delete the user's file documents (with their chats) created before
+    created_before, then the user document itself. Returns (deleted_count, failures).
+    """
+    user_ref = firestore_client.collection("users").document(uid)
+    failures = []
+
+    def on_error(error, bulk_writer):
+        # Let BulkWriter retry a few times, then record the document as failed
+        if error.attempts < 3:
+            return True
+        failures.append({"path": error.operation.reference.path, "error": str(error.message)})
+        return False
+
+    def new_writer():
+        writer = firestore_client.bulk_writer()
+        writer.on_write_error(on_error)
+        return writer
+
+    deleted = 0
+    for file_doc in user_ref.collection("files").stream():
+        if not _created_before((file_doc.to_dict() or {}).get("upload_date"), created_before):
+            continue
+        # recursive_delete closes the writer it is given, so every call gets its own
+        deleted += firestore_client.recursive_delete(file_doc.reference, bulk_writer=new_writer())
+        if on_progress is not None:
+            on_progress(deleted, len(failures))
+    if delete_user_doc:
+        writer = new_writer()
+        try:
+            writer.delete(user_ref)
+            deleted += 1
+        finally:
+            writer.close()
+    return deleted, failures
+
+
+def mark_purge(firestore_client, uid, mode, started):
+    firestore_client.collection(PURGES_COLLECTION).document(uid).set({"mode": mode, "started": started})
+
+
+def clear_purge_marker(firestore_client, uid):
+    firestore_client.collection(PURGES_COLLECTION).document(uid).delete()
+
+
+def purge_in_progress(firestore_client, uid):
+    return firestore_client.collection(PURGES_COLLECTION).document(uid).get().exists
+
+
+def pending_purges(firestore_client):
+    """Return [(uid, mode, started)] for purges that were started but never finished."""
+    return [
+        (doc.id, data.get("mode"), data.get("started"))
+        for doc in firestore_client.collection(PURGES_COLLECTION).stream()
+        for data in [doc.to_dict() or {}]
+    ]
+
+
+def purge_user(storage_client, bucket, firestore_client, uid, started=None, delete_account=None,
+               parallelism=8, job_item=None):
+    """
+    Remove the user's GCS data and Firestore documents, and the account itself when
+    delete_account (a callable taking the uid) is given. The purge marker is cleared only
+    if nothing failed, so a partial purge is picked up again on the next run.
+    """
+    started = started or datetime.datetime.now(datetime.timezone.utc)
+
+    def progress(stage):
+        if job_item is None:
+            return None
+        return lambda done, failed: job_item.stage_progress(stage, count=done)
+
+    if job_item is not None:
+        job_item.start_stage("storage")
+    blobs_deleted, blob_failures = delete_blobs(
+        storage_client, bucket, f"{uid}/", created_before=started, parallelism=parallelism, on_progress=progress("storage")
+    )
+    print(f"Deleted {blobs_deleted} files for user {uid} from GCS ({len(blob_failures)} failed).")
+
+    if job_item is not None:
+        job_item.start_stage("firestore")
+    docs_deleted, doc_failures = delete_user_documents(
+        firestore_client, uid, created_before=started, on_progress=progress("firestore")
+    )
+    print(f"Deleted {docs_deleted} documents for user {uid} from Firestore ({len(doc_failures)} failed).")
+
+    account_deleted = False
+    if delete_account is not None and not (blob_failures or doc_failures):
+        if job_item is not None:
+            job_item.start_stage("account")
+        delete_account(uid)
+        account_deleted = True
+        print(f"Deleted Firebase user {uid}.")
+
+    report = {
+        "deleted_blobs": blobs_deleted,
+        "deleted_documents": docs_deleted,
+        "account_deleted": account_deleted,
+        "failures": blob_failures + doc_failures,
+    }
+    if report["failures"]:
+        raise PurgeIncomplete(report)
+    clear_purge_marker(firestore_client, uid)
+    return report
+
+
+class PurgeIncomplete(Exception):
+    def __init__(self, report):
+        super().__init__(f"{len(report['failures'])} deletions failed; the purge will resume on retry")
+        self.report = report
+        self.detail = {"message": str(self), **report}
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SharedState:
+    """
+    Small SQLite store for state every uvicorn worker on the host must agree on.
+
+        sessions  the file each user has selected with /load_index and two per-user counters:
+                  version, bumped when the user's stored indexes are purged, so workers can
+                  tell that their cached per-file indexes are stale, and files_version, bumped
+                  whenever the set of files changes (upload, purge), which only invalidates
+                  the user's collection index
+        jobs      snapshots of ingest/purge jobs, so /jobs answers on any worker
+        answers   cached LLM answers (see answer_cache.py), so a worker can reuse an answer
+                  another worker paid for
+        claims    one-off tasks that only one worker should run, such as resuming purges
+
+    WAL mode lets the workers read concurrently while one of them writes.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (uid TEXT PRIMARY KEY, fileid TEXT, version INTEGER NOT NULL DEFAULT 0, "
+            "files_version INTEGER NOT NULL DEFAULT 0)"
+        )
+        try:
+            # State files written before files_version existed
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN files_version INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY AUTOINCREMENT, uid TEXT NOT NULL, "
+            "context TEXT NOT NULL, question TEXT NOT NULL, vector BLOB NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_context ON answers (uid, context)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS claims (name TEXT PRIMARY KEY, owner INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _row(self, uid):
+        return self.conn.execute("SELECT fileid, version, files_version FROM sessions WHERE uid = ?", (uid,)).fetchone()
+
+    def get_active(self, uid):
+        with self.lock:
+            row = self._row(uid)
+        return row[0] if row else None
+
+    def set_active(self, uid, fileid):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO sessions (uid, fileid) VALUES (?, ?) ON CONFLICT(uid) DO UPDATE SET fileid = excluded.fileid",
+                (uid, fileid),
+            )
+            self.conn.commit()
+
+    def version(self, uid):
+        with self.lock:
+            row = self._row(uid)
+        return row[1] if row else 0
+
+    def files_version(self, uid):
+        with self.lock:
+            row = self._row(uid)
+        return row[2] if row else 0
+
+    def file_added(self, uid):
+        """Record that a file was added to the user's files and return the new files_version."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO sessions (uid, files_version) VALUES (?, 1) "
+                "ON CONFLICT(uid) DO UPDATE SET files_version = files_version + 1",
+                (uid,),
+            )
+            self.conn.commit()
+            return self._row(uid)[2]
+
+    def purged(self, uid):
+        """Invalidate everything cached for the user and clear their selected file."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO sessions (uid, version, files_version) VALUES (?, 1, 1) "
+                "ON CONFLICT(uid) DO UPDATE SET version = version + 1, files_version = files_version + 1, fileid = NULL",
+                (uid,),
+            )
+            self.conn.commit()
+
+    def put_job(self, job):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, data, updated) VALUES (?, ?, ?)",
+                (job["id"], json.dumps(job, default=str), time.time()),
+            )
+            self.conn.commit()
+
+    def get_job(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune_jobs(self, ttl):
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - ttl,))
+            self.conn.commit()
+
+    def get_answers(self, uid, context, since=0):
+        """Return [(question, vector bytes, answer, created)] stored for the context since the given time."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT question, vector, answer, created FROM answers WHERE uid = ? AND context = ? AND created >= ?",
+                (uid, context, since),
+            ).fetchall()
+
+    def put_answer(self, uid, context, question, vector, answer):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO answers (uid, context, question, vector, answer, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (uid, context, question, vector, answer, time.time()),
+            )
+            self.conn.commit()
+
+    def drop_answers(self, uid):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers WHERE uid = ?", (uid,))
+            self.conn.commit()
+
+    def prune_answers(self, ttl=None, max_entries=None):
+        """Remove answers older than ttl seconds and the oldest beyond max_entries."""
+        with self.lock:
+            if ttl:
+                self.conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - ttl,))
+            if max_entries:
+                self.conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                )
+            self.conn.commit()
+
+    def claim(self, name, ttl):
+        """Return True for the first worker to claim name, and again for anyone after ttl seconds."""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO claims (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE claims.expires < ?",
+                (name, os.getpid(), now + ttl, now),
+            )
+            self.conn.commit()
+            return cursor.rowcount == 1
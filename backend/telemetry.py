@@ -0,0 +1,166 @@
+"""
+Prometheus metrics and lightweight span tracing.
+
+Stage timings are recorded in histograms and exported in Prometheus text format by /metrics.
+Every request runs under a trace id (its X-Request-ID header, or a generated one) held in a
+context variable, which is copied into ingestion worker threads with the job. With
+TRACE_SPANS=true each finished span is printed as one JSON line carrying that trace id, so a
+single upload can be followed through extract, chunk, embed, index and persist.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory before the
+workers start: histograms and counters are then written there by every worker and /metrics
+aggregates them, whichever worker serves the scrape. Index cache stats are per process and
+come from the worker that answered.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import time
+import uuid
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+TRACE_SPANS = os.getenv("TRACE_SPANS", "false").lower() == "true"
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "queryfile_request_seconds", "HTTP request latency until the response starts",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+QUERY_STAGE_SECONDS = Histogram(
+    "queryfile_query_stage_seconds", "Time spent in each stage of /query and /query/stream",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+JOB_STAGE_SECONDS = Histogram(
+    "queryfile_job_stage_seconds", "Time spent in each stage of background ingest and purge jobs",
+    ["kind", "stage", "status"], buckets=LATENCY_BUCKETS,
+)
+OCR_FALLBACKS = Counter("queryfile_ocr_fallbacks_total", "PDFs with pages sent to OCR because their text layer was too sparse")
+OCR_PAGES = Counter("queryfile_ocr_pages_total", "PDF pages sent to OCR")
+STORAGE_BYTES = Counter("queryfile_storage_bytes_total", "Bytes transferred to and from blob storage", ["direction"])
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+@contextlib.contextmanager
+def trace(trace_id):
+    """Run the block under the given trace id."""
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+def record_span(name, seconds, trace_id=None, parent=None, **attrs):
+    if not TRACE_SPANS:
+        return
+    print(json.dumps({
+        "trace_id": trace_id or _trace_id.get(),
+        "span": name,
+        "parent": parent,
+        "seconds": round(seconds, 6),
+        **attrs,
+    }, default=str))
+
+
+@contextlib.contextmanager
+def span(name, histogram=None, **attrs):
+    """
+    Time the block, observe it on histogram (a labelled child) if given and record it as a
+    span nested under the enclosing one.
+    """
+    parent = _span.get()
+    token = _span.set(name)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _span.reset(token)
+        if histogram is not None:
+            histogram.observe(seconds)
+        record_span(name, seconds, parent=parent, status=status, **attrs)
+
+
+def query_stage(stage):
+    return span(f"query.{stage}", QUERY_STAGE_SECONDS.labels(stage=stage))
+
+
+def observe_job_stage(job, item, stage, entry):
+    """JobQueue stage hook: record a finished job stage as a histogram sample and a span."""
+    JOB_STAGE_SECONDS.labels(kind=job.kind, stage=stage, status=entry["status"]).observe(entry["seconds"])
+    record_span(
+        f"{job.kind}.{stage}", entry["seconds"], trace_id=job.trace_id, parent=job.kind,
+        job_id=job.id, item=item.name, status=entry["status"],
+    )
+
+
+class CacheCollector:
+    """Exports the stats() of IndexCache instances at scrape time."""
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"queryfile_index_cache_{name}", help_text, labels=["cache"])
+            for name, help_text in [
+                ("entries", "Entries held in the cache"),
+                ("bytes", "Bytes held in the cache"),
+                ("max_bytes", "Cache capacity in bytes"),
+            ]
+        }
+        counters = {
+            name: CounterMetricFamily(f"queryfile_index_cache_{name}", help_text, labels=["cache"])
+            for name, help_text in [
+                ("hits", "Cache lookups that found an entry"),
+                ("misses", "Cache lookups that missed"),
+                ("evictions", "Entries evicted to stay under max_bytes"),
+                ("expirations", "Entries dropped after the TTL"),
+            ]
+        }
+        for cache_name, cache in self.caches.items():
+            stats = cache.stats()
+            for name, family in {**gauges, **counters}.items():
+                family.add_metric([cache_name], stats[name])
+        yield from gauges.values()
+        yield from counters.values()
+
+
+_collectors = []
+
+
+def register_caches(caches):
+    collector = CacheCollector(caches)
+    _collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_metrics():
+    """Return (body, content_type) of the Prometheus exposition."""
+    if not MULTIPROC_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _collectors:
+        registry.register(collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
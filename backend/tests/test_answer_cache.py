@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+
+from answer_cache import AnswerCache, context_key, depends_on_history
+from shared_state import SharedState
+
+RESULTS = [("file", 0, "first chunk"), ("file", 3, "second chunk")]
+
+
+def embedding(seed):
+    return np.random.default_rng(seed).standard_normal(8).astype("float32")
+
+
+def test_key_depends_on_retrieved_context():
+    assert context_key(RESULTS) == context_key(list(RESULTS))
+    assert context_key(RESULTS[:1]) != context_key(RESULTS)
+    assert context_key([("other", 0, "first chunk"), RESULTS[1]]) != context_key(RESULTS)
+
+
+def test_follow_up_questions():
+    assert depends_on_history("Can you explain that in more detail?")
+    assert depends_on_history("why?")
+    assert depends_on_history("What did they agree to?")
+    assert not depends_on_history("What are the payment terms of the contract?")
+    assert not depends_on_history("Summarize the key dates and deadlines")
+
+
+def test_skip_neither_returns_nor_stores():
+    cache = AnswerCache()
+    key = context_key(RESULTS)
+    cache.lookup("uid", key, "question", embedding(1)).store("answer")
+    skipped = cache.skip("uid", key, "question", embedding(1))
+    assert skipped.answer is None
+    skipped.store("other answer")
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["skipped"] == 1
+
+
+def test_hit_for_similar_question_only():
+    cache = AnswerCache()
+    key = context_key(RESULTS)
+    cache.lookup("uid", key, "question", embedding(1)).store("answer")
+    hit = cache.lookup("uid", key, "question?", embedding(1) * 1.01)
+    assert hit.answer == "answer"
+    assert cache.lookup("uid", key, "other", embedding(2)).answer is None
+    assert cache.lookup("other", key, "question", embedding(1)).answer is None
+
+
+def test_workers_share_answers(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    first = AnswerCache(shared=SharedState(path))
+    second = AnswerCache(shared=SharedState(path))
+    key = context_key(RESULTS)
+    first.lookup("uid", key, "question", embedding(1)).store("answer")
+
+    assert second.lookup("uid", key, "question", embedding(1)).answer == "answer"
+    assert second.stats()["entries"] == 1
+
+    second.invalidate_user("uid")
+    assert first.shared.get_answers("uid", key) == []
+    assert AnswerCache(shared=SharedState(path)).lookup("uid", key, "question", embedding(1)).answer is None
+
+
+def test_shared_answers_expire(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    state.put_answer("uid", "key", "question", embedding(1).tobytes(), "answer")
+    state.put_answer("uid", "key", "question 2", embedding(2).tobytes(), "answer 2")
+    state.prune_answers(max_entries=1)
+    assert [row[0] for row in state.get_answers("uid", "key")] == ["question 2"]
+    assert state.get_answers("uid", "key", since=time.time() + 1) == []
+    assert AnswerCache(ttl=60, shared=state).lookup("uid", "key", "question 2", embedding(2)).answer == "answer 2"
@@ -0,0 +1,98 @@
+import json
+import struct
+
+import pytest
+
+from chunk_store import HEADER, ChunkStore, ChunkStoreWriter, convert_json_chunks, is_chunk_store, load_chunks, write_chunk_store
+
+CHUNKS = ["first chunk", "", "ünïcødé — text", "last " * 100]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "file.chunks")
+    write_chunk_store(path, CHUNKS, pages=[1, 1, 2, None])
+    store = ChunkStore.open(path)
+    assert len(store) == len(CHUNKS)
+    assert list(store) == CHUNKS
+    assert [store.page(i) for i in range(len(CHUNKS))] == [1, 1, 2, None]
+
+
+def test_random_access(tmp_path):
+    path = str(tmp_path / "file.chunks")
+    chunks = [f"chunk {i}" for i in range(1000)]
+    write_chunk_store(path, chunks)
+    store = ChunkStore.open(path)
+    for idx in (0, 999, 500, 17, -1):
+        assert store[idx] == chunks[idx]
+    assert store.page(3) is None
+    with pytest.raises(IndexError):
+        store[1000]
+
+
+def test_streaming_writer(tmp_path):
+    path = str(tmp_path / "file.chunks")
+    with ChunkStoreWriter(path) as writer:
+        for i, chunk in enumerate(CHUNKS):
+            writer.add(chunk, i)
+        assert len(writer) == len(CHUNKS)
+    assert ChunkStore.open(path)[2] == CHUNKS[2]
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "file.chunks")
+    write_chunk_store(path, [])
+    assert len(ChunkStore.open(path)) == 0
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "file.chunks"
+    path.write_bytes(b"not a chunk store".ljust(HEADER.size, b"\x00"))
+    assert not is_chunk_store(str(path))
+    with pytest.raises(ValueError):
+        ChunkStore.open(str(path))
+
+
+def test_rejects_newer_version(tmp_path):
+    path = tmp_path / "file.chunks"
+    write_chunk_store(str(path), CHUNKS)
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<H", data, 8, 99)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        ChunkStore.open(str(path))
+
+
+def test_rejects_truncated_file(tmp_path):
+    path = tmp_path / "file.chunks"
+    write_chunk_store(str(path), CHUNKS)
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) - 16])
+    with pytest.raises(ValueError):
+        ChunkStore.open(str(path))
+
+
+def test_rejects_short_header(tmp_path):
+    path = tmp_path / "file.chunks"
+    path.write_bytes(b"QFCHUNK\x00\x01")
+    with pytest.raises(ValueError):
+        ChunkStore.open(str(path))
+
+
+def test_rejects_corrupt_offsets(tmp_path):
+    path = tmp_path / "file.chunks"
+    write_chunk_store(str(path), CHUNKS)
+    data = bytearray(path.read_bytes())
+    offsets_pos = HEADER.unpack_from(data, 0)[5]
+    struct.pack_into("<Q", data, offsets_pos + 8 * len(CHUNKS), 1 << 40)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        ChunkStore.open(str(path))
+
+
+def test_converts_json_chunks(tmp_path):
+    json_path = tmp_path / "file.chunks.json"
+    json_path.write_text(json.dumps(CHUNKS))
+    assert load_chunks(str(json_path)) == CHUNKS
+    out_path = str(tmp_path / "file.chunks.bin")
+    assert convert_json_chunks(str(json_path), out_path) == len(CHUNKS)
+    assert list(load_chunks(out_path)) == CHUNKS
@@ -0,0 +1,100 @@
+import faiss
+import numpy as np
+import pytest
+
+from collection_index import CollectionIndex, index_vectors
+from index_factory import build_index, choose_index_spec
+from index_registry import mmap_flags
+
+DIMENSION = 16
+
+
+def file_vectors(seed, n=50):
+    return np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype("float32")
+
+
+def chunks_for(name, n=50):
+    return [f"{name} chunk {i}" for i in range(n)]
+
+
+def spec_for(kind, vectors):
+    if kind == "flat":
+        return None
+    return choose_index_spec(len(vectors), DIMENSION, removable=True, flat_max_vectors=0,
+                             recall_target=1.0 if kind == "ivfflat" else 0.5,
+                             memory_bytes_per_vector=None if kind == "ivfflat" else 24)
+
+
+@pytest.fixture(params=["flat", "ivfflat", "ivfsq"])
+def collection(request):
+    training = np.vstack([file_vectors(seed) for seed in range(20)])
+    spec = spec_for(request.param, training)
+    assert spec is None or spec["type"] == request.param
+    return CollectionIndex(DIMENSION, spec, training)
+
+
+def test_search_across_files(collection):
+    collection.add_file("a", file_vectors(1), chunks_for("a"))
+    collection.add_file("b", file_vectors(2), chunks_for("b"))
+    results = collection.search(file_vectors(2)[7:8], 1)
+    assert results[0][:3] == ("b", 7, "b chunk 7")
+    results = collection.search(file_vectors(1)[3:4], 1)
+    assert results[0][:3] == ("a", 3, "a chunk 3")
+
+
+def test_search_subset(collection):
+    collection.add_file("a", file_vectors(1), chunks_for("a"))
+    collection.add_file("b", file_vectors(2), chunks_for("b"))
+    results = collection.search(file_vectors(2)[7:8], 5, fileids=["a"])
+    assert results and {fileid for fileid, _, _, _ in results} == {"a"}
+    assert collection.search(file_vectors(1)[:1], 5, fileids=["missing"]) == []
+
+
+def test_incremental_add_and_remove(collection):
+    collection.add_file("a", file_vectors(1), chunks_for("a"))
+    collection.add_file("b", file_vectors(2), chunks_for("b"))
+    collection.remove_file("a")
+    assert "a" not in collection
+    assert collection.index.ntotal == 50
+    results = collection.search(file_vectors(1)[3:4], 10)
+    assert "a" not in {fileid for fileid, _, _, _ in results}
+
+    collection.add_file("c", file_vectors(3, n=10), chunks_for("c", n=10))
+    assert collection.index.ntotal == 60
+    assert collection.search(file_vectors(3)[4:5], 1)[0][:2] == ("c", 4)
+    collection.remove_file("missing")
+    assert collection.index.ntotal == 60
+
+
+def test_re_adding_a_file_replaces_it(collection):
+    collection.add_file("a", file_vectors(1), chunks_for("a"))
+    collection.add_file("a", file_vectors(4, n=5), chunks_for("new", n=5))
+    assert collection.index.ntotal == 5
+    assert collection.search(file_vectors(4)[2:3], 1)[0][:3] == ("a", 2, "new chunk 2")
+
+
+def test_restore_mapped(collection, tmp_path):
+    collection.add_file("a", file_vectors(1), chunks_for("a"))
+    collection.add_file("b", file_vectors(2), chunks_for("b"))
+    collection.remove_file("a")
+    collection.add_file("c", file_vectors(3), chunks_for("c"))
+    path = str(tmp_path / "collection.index")
+    state = collection.write(path)
+
+    index = faiss.read_index(path, mmap_flags(collection.spec))
+    mapped = CollectionIndex.restore(index, collection.spec, state, {"b": chunks_for("b"), "c": chunks_for("c")})
+    assert set(mapped.slots) == {"b", "c"}
+    assert mapped.search(file_vectors(3)[7:8], 1)[0][:3] == ("c", 7, "c chunk 7")
+    results = mapped.search(file_vectors(3)[7:8], 5, fileids=["b"])
+    assert results and {fileid for fileid, _, _, _ in results} == {"b"}
+    assert mapped.nbytes() < collection.nbytes()
+    with pytest.raises(ValueError):
+        mapped.add_file("d", file_vectors(4), chunks_for("d"))
+
+
+def test_index_vectors_round_trip():
+    vectors = file_vectors(1, n=2000)
+    assert np.allclose(index_vectors(build_index(vectors, {"type": "flat", "params": {}})), vectors)
+    spec = choose_index_spec(len(vectors), DIMENSION, removable=True, flat_max_vectors=0)
+    assert np.allclose(index_vectors(build_index(vectors, spec)), vectors)
+    assert index_vectors(faiss.IndexFlatL2(DIMENSION)).shape == (0, DIMENSION)
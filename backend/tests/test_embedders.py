@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from embedders import COSINE_TOLERANCE, verify
+
+MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("onnx_models", MODEL))
+
+
+@pytest.mark.parametrize("backend", list(COSINE_TOLERANCE))
+def test_onnx_matches_torch(backend):
+    # Runs where the model and an export are available, as in the Docker builder stage
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    if not os.path.isdir(ONNX_DIR):
+        pytest.skip(f"no ONNX export in {ONNX_DIR}")
+    report = verify(backend, MODEL, ONNX_DIR, repeats=1)
+    assert report["passed"], report
@@ -0,0 +1,34 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def vectors(keys):
+    return [(key, np.full(4, i, dtype="float32")) for i, key in enumerate(keys)]
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"))
+    cache.put_many(vectors(["a", "b"]))
+    found = cache.get_many(["a", "b", "c"])
+    assert sorted(found) == ["a", "b"]
+    assert list(found["b"]) == [1, 1, 1, 1]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_prunes_only_past_slack(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), max_entries=10, prune_slack=0.5)
+    cache.put_many(vectors([f"k{i}" for i in range(15)]))
+    assert cache.stats()["entries"] == 15
+    cache.put_many(vectors(["k15"]))
+    assert cache.stats()["entries"] == 10
+
+
+def test_hits_keep_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), max_entries=4, prune_slack=0, touch_batch=1)
+    cache.put_many(vectors(["old", "a", "b", "c"]))
+    cache.get_many(["old"])
+    cache.put_many(vectors(["d"]))
+    remaining = cache.get_many(["old", "a", "b", "c", "d"])
+    assert "old" in remaining
+    assert len(remaining) == 4
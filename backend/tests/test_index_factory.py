@@ -0,0 +1,39 @@
+from index_factory import choose_index_spec, code_bytes, estimated_recall
+
+DIMENSION = 384
+N_VECTORS = 200000
+
+
+def choose(**options):
+    return choose_index_spec(N_VECTORS, DIMENSION, flat_max_vectors=20000, **options)
+
+
+def test_small_indexes_are_flat():
+    assert choose_index_spec(1000, DIMENSION)["type"] == "flat"
+
+
+def test_default_types():
+    assert choose()["type"] == "hnsw"
+    assert choose(removable=True)["type"] == "ivfflat"
+
+
+def test_budget_below_hnsw_keeps_full_vectors():
+    assert choose(memory_bytes_per_vector=DIMENSION * 4 + 8)["type"] == "ivfflat"
+
+
+def test_budget_picks_largest_code_that_fits():
+    spec = choose(memory_bytes_per_vector=DIMENSION + 8)
+    assert spec["type"] == "ivfsq"
+    assert spec["params"]["bits"] == 8
+
+
+def test_budget_too_small_for_recall_target_falls_back_to_larger_code():
+    spec = choose(memory_bytes_per_vector=64, recall_target=0.95)
+    assert estimated_recall(spec, DIMENSION) >= 0.95
+    assert code_bytes(spec, DIMENSION) + 8 > 64
+
+
+def test_budget_uses_pq_when_recall_target_allows():
+    spec = choose(memory_bytes_per_vector=64, recall_target=0.5, removable=True)
+    assert spec["type"] == "ivfpq"
+    assert code_bytes(spec, DIMENSION) + 8 <= 64
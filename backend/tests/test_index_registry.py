@@ -0,0 +1,88 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from chunk_store import write_chunk_store
+from index_factory import build_index, choose_index_spec
+from index_registry import IndexRegistry
+
+DIMENSION = 32
+N_VECTORS = 12000
+
+SPECS = {
+    "flat": dict(flat_max_vectors=N_VECTORS),
+    "hnsw": dict(flat_max_vectors=0),
+    "ivfflat": dict(flat_max_vectors=0, removable=True),
+    "ivfsq": dict(flat_max_vectors=0, memory_bytes_per_vector=DIMENSION + 8),
+    "ivfpq": dict(flat_max_vectors=0, memory_bytes_per_vector=20, recall_target=0.5),
+}
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((N_VECTORS, DIMENSION)).astype("float32")
+
+
+def publish(registry, tmp_path, vectors, spec, fileid="file"):
+    index_file = tmp_path / f"{fileid}.index.tmp"
+    chunks_file = tmp_path / f"{fileid}.chunks.tmp"
+    faiss.write_index(build_index(vectors, spec), str(index_file))
+    write_chunk_store(str(chunks_file), [f"chunk {i}" for i in range(len(vectors))], [i // 10 for i in range(len(vectors))])
+    registry.publish("uid", fileid, str(index_file), str(chunks_file), spec)
+
+
+@pytest.mark.parametrize("kind", list(SPECS))
+def test_open_every_spec_type(tmp_path, vectors, kind):
+    spec = choose_index_spec(N_VECTORS, DIMENSION, **SPECS[kind])
+    assert spec["type"] == kind
+    registry = IndexRegistry(str(tmp_path / "registry"))
+    publish(registry, tmp_path, vectors, spec)
+
+    index, chunks, index_nbytes, _ = registry.open("uid", "file")
+    assert index.ntotal == N_VECTORS
+    assert index_nbytes > 0
+    _, ids = index.search(vectors[:5], 1)
+    if kind == "ivfpq":
+        assert (ids >= 0).all()
+    else:
+        assert list(ids[:, 0]) == list(range(5))
+    assert chunks[3] == "chunk 3"
+    assert chunks.page(12) == 1
+
+
+def test_open_missing_entry(tmp_path):
+    registry = IndexRegistry(str(tmp_path))
+    assert registry.open("uid", "missing") is None
+
+
+def test_open_entry_removed_after_sidecar(tmp_path, vectors):
+    registry = IndexRegistry(str(tmp_path / "registry"))
+    publish(registry, tmp_path, vectors[:100], {"type": "flat", "params": {}})
+    index_path, _, _ = registry.paths("uid", "file")
+    os.remove(index_path)
+    assert registry.open("uid", "file") is None
+
+
+def test_prune_keeps_budget(tmp_path, vectors):
+    registry = IndexRegistry(str(tmp_path / "registry"))
+    spec = {"type": "flat", "params": {}}
+    publish(registry, tmp_path, vectors[:1000], spec, fileid="old")
+    registry.max_bytes = sum(nbytes for _, nbytes, _, _ in registry.entries()) + 1
+    publish(registry, tmp_path, vectors[:1000], spec, fileid="new")
+    assert [fileid for _, _, _, fileid in registry.entries()] == ["new"]
+
+
+def test_index_only_entry(tmp_path, vectors):
+    registry = IndexRegistry(str(tmp_path / "registry"))
+    spec = {"type": "flat", "params": {}}
+    index_file = tmp_path / "collection.index.tmp"
+    faiss.write_index(build_index(vectors[:100], spec), str(index_file))
+    registry.publish("uid", "_collection", str(index_file), None, spec, extra={"files_version": 3})
+
+    index, meta, index_nbytes = registry.open_index("uid", "_collection")
+    assert index.ntotal == 100
+    assert meta["files_version"] == 3 and meta["spec"] == spec
+    assert [(uid, fileid) for _, _, uid, fileid in registry.entries()] == [("uid", "_collection")]
+    assert registry.entries()[0][1] == index_nbytes
@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.mock_llm import create_app
+from llm_client import DeepSeekClient, LLMError
+
+API_URL = "http://mock/v1/chat/completions"
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "hi"}]}
+ANSWER = "token0 token1 token2 "
+
+
+class FlakyTransport(httpx.AsyncBaseTransport):
+    """Fails the first connect_failures requests with a connect error, then serves the app."""
+
+    def __init__(self, app, connect_failures=0):
+        self.inner = httpx.ASGITransport(app=app)
+        self.connect_failures = connect_failures
+        self.attempts = 0
+
+    async def handle_async_request(self, request):
+        self.attempts += 1
+        if self.attempts <= self.connect_failures:
+            raise httpx.ConnectError("connection refused", request=request)
+        return await self.inner.handle_async_request(request)
+
+
+def make_client(transport, max_retries=2):
+    client = DeepSeekClient(API_URL, "key", max_retries=max_retries)
+    client._client = httpx.AsyncClient(transport=transport)
+
+    async def no_backoff(attempt):
+        pass
+
+    client._backoff = no_backoff
+    return client
+
+
+def mock_app(**options):
+    return create_app(first_token_ms=0, tokens=3, token_interval_ms=0, **options)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def collect(client):
+    try:
+        return "".join([delta async for delta in client.stream(PAYLOAD)])
+    finally:
+        await client.close()
+
+
+async def complete(client):
+    try:
+        return await client.complete(PAYLOAD)
+    finally:
+        await client.close()
+
+
+def test_complete_retries_transient_status():
+    app = mock_app(fail_requests=2, fail_status=503)
+    assert run(complete(make_client(FlakyTransport(app)))) == ANSWER
+    assert app.state.requests == 3
+
+
+def test_complete_gives_up_after_max_retries():
+    app = mock_app(fail_requests=3, fail_status=503)
+    with pytest.raises(LLMError, match="mock failure"):
+        run(complete(make_client(FlakyTransport(app))))
+    assert app.state.requests == 3
+
+
+def test_complete_does_not_retry_client_errors():
+    app = mock_app(fail_requests=1, fail_status=400)
+    with pytest.raises(LLMError):
+        run(complete(make_client(FlakyTransport(app))))
+    assert app.state.requests == 1
+
+
+def test_complete_retries_connect_errors():
+    transport = FlakyTransport(mock_app(), connect_failures=2)
+    assert run(complete(make_client(transport))) == ANSWER
+    assert transport.attempts == 3
+
+
+def test_stream_yields_deltas():
+    assert run(collect(make_client(FlakyTransport(mock_app())))) == ANSWER
+
+
+def test_stream_retries_after_non_200():
+    app = mock_app(fail_requests=1, fail_status=429)
+    assert run(collect(make_client(FlakyTransport(app)))) == ANSWER
+    assert app.state.requests == 2
+
+
+def test_stream_raises_after_non_retryable_status():
+    app = mock_app(fail_requests=1, fail_status=401)
+    with pytest.raises(LLMError, match="mock failure"):
+        run(collect(make_client(FlakyTransport(app))))
+    assert app.state.requests == 1
+
+
+def test_stream_retries_connect_failure():
+    transport = FlakyTransport(mock_app(), connect_failures=1)
+    assert run(collect(make_client(transport))) == ANSWER
+    assert transport.attempts == 2
+
+
+def test_stream_connect_failure_exhausts_retries():
+    transport = FlakyTransport(mock_app(), connect_failures=5)
+    with pytest.raises(LLMError, match="request failed"):
+        run(collect(make_client(transport, max_retries=1)))
+    assert transport.attempts == 2
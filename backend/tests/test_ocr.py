@@ -0,0 +1,109 @@
+import threading
+
+import fitz
+import pytest
+
+from local_backends import LocalStorageClient, LocalVisionClient
+from ocr import iter_ocr_merged
+from pdf_extract import extract_page_range
+
+SPARSE_PAGES = [2, 3, 6, 9]
+PAGE_COUNT = 10
+
+
+def is_sparse(text):
+    return len(text.strip()) < 20
+
+
+@pytest.fixture
+def mixed_pdf(tmp_path):
+    """Pages with a text layer, and "scanned" pages with only a short label in theirs."""
+    path = str(tmp_path / "mixed.pdf")
+    doc = fitz.open()
+    for number in range(1, PAGE_COUNT + 1):
+        page = doc.new_page()
+        text = f"scan {number}" if number in SPARSE_PAGES else f"text of page {number} " * 5
+        page.insert_text((72, 72), text)
+    doc.save(path)
+    return path
+
+
+def extracted_pages(path):
+    return iter(extract_page_range(path, 0, PAGE_COUNT))
+
+
+class StubOCR:
+    def __init__(self):
+        self.calls = []
+
+    def ocr_pages(self, file_path, pages):
+        self.calls.append(list(pages))
+        return {page: f"ocr of page {page}" for page in pages}
+
+
+def test_only_sparse_pages_are_sent_and_order_is_kept(mixed_pdf):
+    backend = StubOCR()
+    merged = list(iter_ocr_merged(
+        extracted_pages(mixed_pdf), lambda pages: backend.ocr_pages(mixed_pdf, pages), is_sparse, window_pages=2,
+    ))
+    assert [number for number, _ in merged] == list(range(1, PAGE_COUNT + 1))
+    assert [page for call in backend.calls for page in call] == SPARSE_PAGES
+    assert all(len(call) <= 2 for call in backend.calls)
+    for number, text in merged:
+        if number in SPARSE_PAGES:
+            assert text == f"ocr of page {number}"
+        else:
+            assert text.startswith(f"text of page {number}")
+
+
+def test_vision_backend_on_mixed_pdf(mixed_pdf, tmp_path):
+    pytest.importorskip("google.cloud.vision_v1")
+    from ocr import VisionOCR
+
+    storage_client = LocalStorageClient(str(tmp_path / "storage"))
+    bucket = storage_client.bucket("bucket")
+    backend = VisionOCR(LocalVisionClient(storage_client), bucket)
+    sent = []
+
+    def ocr_pages(pages):
+        sent.extend(pages)
+        return backend.ocr_pages(mixed_pdf, pages)
+
+    merged = list(iter_ocr_merged(extracted_pages(mixed_pdf), ocr_pages, is_sparse, window_pages=3))
+    assert sent == SPARSE_PAGES
+    assert [number for number, _ in merged] == list(range(1, PAGE_COUNT + 1))
+    # The local client reads the subset PDF's text layer, so every page keeps its own label
+    for number in SPARSE_PAGES:
+        assert dict(merged)[number].strip() == f"scan {number}"
+    assert list(bucket.list_blobs(prefix="temp/ocr/")) == []
+
+
+def test_pages_before_pending_ocr_are_not_held():
+    release = threading.Event()
+
+    def ocr_pages(pages):
+        release.wait(timeout=5)
+        return {page: "ocr" for page in pages}
+
+    pages = [(1, "text " * 10), (2, ""), (3, "text " * 10)]
+    merged = iter_ocr_merged(iter(pages), ocr_pages, is_sparse, window_pages=1)
+    assert next(merged) == (1, pages[0][1])
+    release.set()
+    assert list(merged) == [(2, "ocr"), (3, pages[2][1])]
+
+
+def test_held_pages_are_bounded():
+    calls = []
+
+    def ocr_pages(pages):
+        calls.append(list(pages))
+        return {}
+
+    # One sparse page followed by many text pages: the window is sent early once too many are held
+    pages = [(1, "")] + [(n, "text " * 10) for n in range(2, 30)]
+    seen = []
+    for number, _ in iter_ocr_merged(iter(pages), ocr_pages, is_sparse, window_pages=10, max_held_pages=5):
+        seen.append(number)
+        if number == 1:
+            assert calls == [[1]]
+    assert seen == list(range(1, 30))
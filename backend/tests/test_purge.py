@@ -0,0 +1,114 @@
+import datetime
+import time
+
+import pytest
+
+from local_backends import LocalFirestore, LocalStorageClient
+from purge import PurgeIncomplete, mark_purge, pending_purges, purge_in_progress, purge_user
+
+UID = "user"
+
+
+@pytest.fixture
+def storage(tmp_path):
+    client = LocalStorageClient(str(tmp_path / "storage"))
+    return client, client.bucket("bucket")
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def add_blobs(bucket, *names):
+    for name in names:
+        bucket.blob(name).upload_from_string(b"data")
+
+
+def add_file(firestore, fileid, uploaded):
+    file_ref = firestore.collection("users").document(UID).collection("files").document(fileid)
+    file_ref.set({"filename": f"{fileid}.pdf", "upload_date": uploaded})
+    file_ref.collection("chats").add({"type": "user", "text": "hi"})
+
+
+def blob_names(bucket):
+    return [blob.name for blob in bucket.list_blobs(prefix=f"{UID}/")]
+
+
+def file_ids(firestore):
+    return [doc.id for doc in firestore.collection("users").document(UID).collection("files").stream()]
+
+
+def test_purge_removes_everything_and_clears_marker(storage):
+    storage_client, bucket = storage
+    firestore = LocalFirestore()
+    add_blobs(bucket, f"{UID}/pdf/a.pdf", f"{UID}/index/a.index", "other/pdf/b.pdf")
+    add_file(firestore, "a", now())
+    add_file(firestore, "b", now())
+    firestore.collection("users").document(UID).set({"email": "user@example.com"})
+    started = now()
+    mark_purge(firestore, UID, "data", started)
+    assert pending_purges(firestore) == [(UID, "data", started)]
+    assert purge_in_progress(firestore, UID)
+
+    deleted = []
+    report = purge_user(storage_client, bucket, firestore, UID, started, delete_account=deleted.append)
+    assert report["deleted_blobs"] == 2
+    assert report["account_deleted"] and deleted == [UID]
+    assert blob_names(bucket) == []
+    assert [blob.name for blob in bucket.list_blobs()] == ["other/pdf/b.pdf"]
+    assert file_ids(firestore) == []
+    assert not any(path.startswith(f"users/{UID}") for path in firestore.docs)
+    assert pending_purges(firestore) == []
+    assert not purge_in_progress(firestore, UID)
+
+
+def test_partial_purge_keeps_marker_and_resumes(storage, monkeypatch):
+    storage_client, bucket = storage
+    firestore = LocalFirestore()
+    add_blobs(bucket, f"{UID}/pdf/a.pdf", f"{UID}/pdf/b.pdf", f"{UID}/index/a.index")
+    add_file(firestore, "a", now())
+    started = now()
+    mark_purge(firestore, UID, "account", started)
+
+    delete_blob = bucket.delete_blob
+
+    def failing_delete(name):
+        if name == f"{UID}/pdf/b.pdf":
+            raise RuntimeError("unavailable")
+        delete_blob(name)
+
+    monkeypatch.setattr(bucket, "delete_blob", failing_delete)
+    deleted = []
+    with pytest.raises(PurgeIncomplete) as error:
+        purge_user(storage_client, bucket, firestore, UID, started, delete_account=deleted.append)
+    assert [f["name"] for f in error.value.report["failures"]] == [f"{UID}/pdf/b.pdf"]
+    assert blob_names(bucket) == [f"{UID}/pdf/b.pdf"]
+    assert deleted == []
+    assert pending_purges(firestore) == [(UID, "account", started)]
+
+    # Resumed later with the marker's start time, as resume_purges does
+    monkeypatch.setattr(bucket, "delete_blob", delete_blob)
+    (uid, mode, resumed_started), = pending_purges(firestore)
+    report = purge_user(storage_client, bucket, firestore, uid, resumed_started, delete_account=deleted.append)
+    assert report["deleted_blobs"] == 1
+    assert deleted == [UID]
+    assert blob_names(bucket) == []
+    assert pending_purges(firestore) == []
+
+
+def test_keeps_data_created_after_the_purge_started(storage):
+    storage_client, bucket = storage
+    firestore = LocalFirestore()
+    add_blobs(bucket, f"{UID}/pdf/old.pdf")
+    add_file(firestore, "old", now())
+    time.sleep(0.05)
+    started = now()
+    time.sleep(0.05)
+    add_blobs(bucket, f"{UID}/pdf/new.pdf")
+    add_file(firestore, "new", now())
+
+    report = purge_user(storage_client, bucket, firestore, UID, started)
+    assert report["deleted_blobs"] == 1
+    assert blob_names(bucket) == [f"{UID}/pdf/new.pdf"]
+    assert file_ids(firestore) == ["new"]
+    assert firestore.collection("users").document(UID).collection("files").document("new").collection("chats").stream()
@@ -0,0 +1,34 @@
+import sqlite3
+
+from shared_state import SharedState
+
+
+def test_upload_only_changes_files_version(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    state.set_active("uid", "a")
+    assert state.file_added("uid") == 1
+    assert state.file_added("uid") == 2
+    assert state.version("uid") == 0
+    assert state.get_active("uid") == "a"
+
+
+def test_purge_bumps_both_versions(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    state.set_active("uid", "a")
+    state.file_added("uid")
+    state.purged("uid")
+    assert state.version("uid") == 1
+    assert state.files_version("uid") == 2
+    assert state.get_active("uid") is None
+
+
+def test_adds_files_version_to_existing_state(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (uid TEXT PRIMARY KEY, fileid TEXT, version INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("INSERT INTO sessions (uid, fileid, version) VALUES ('uid', 'a', 3)")
+    conn.commit()
+    conn.close()
+    state = SharedState(path)
+    assert state.version("uid") == 3
+    assert state.file_added("uid") == 1
@@ -31,6 +31,40 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
 
 const db = getFirestore(getApp());
 
+// Uploads are processed in the background; poll the job until it finishes
+const waitForJob = async (jobId, intervalMs = 1000) => {
+  for (;;) {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error(`Job status failed with status: ${response.status}`);
+    }
+    const job = await response.json();
+    if (job.status !== "queued" && job.status !== "running") {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+// Read a server-sent event stream ("data: {...}" events) and pass each parsed event to onEvent
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const event of events) {
+      if (event.startsWith("data:")) {
+        onEvent(JSON.parse(event.slice("data:".length)));
+      }
+    }
+  }
+};
+
 const useMobile = () => {
   const [isMobile, setIsMobile] = useState(window.innerWidth < 768);
   useEffect(() => {
@@ -47,6 +81,7 @@ const MainPage = () => {
   const [activeFile, setActiveFile] = useState(null);
   const [chatHistory, setChatHistory] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [streamingText, setStreamingText] = useState(""); // Answer tokens received so far
   const [isUploading, setIsUploading] = useState(false);
   const [isRestoring, setIsRestoring] = useState(true);
   const [isLoadingFile, setIsLoadingFile] = useState(false);
@@ -138,7 +173,7 @@ const MainPage = () => {
     if (chatAreaRef.current) {
       chatAreaRef.current.scrollTop = chatAreaRef.current.scrollHeight;
     }
-  }, [chatHistory, isLoading]);
+  }, [chatHistory, isLoading, streamingText]);
 
   useEffect(() => {
     const updateHeight = () => {
@@ -220,8 +255,14 @@ const MainPage = () => {
           errorData.detail || `Upload failed with status: ${response.status}`
         );
       }
-      const data = await response.json();
-      console.log("Upload response:", data);
+      const accepted = await response.json();
+      console.log("Upload response:", accepted);
+      const job = await waitForJob(accepted.job_id);
+      const item = job.items[0];
+      if (item.status !== "done") {
+        throw new Error(item.error || "Upload processing failed");
+      }
+      const data = item.result;
 
       const uploadedFile = {
         id: data.id,
@@ -334,7 +375,8 @@ const MainPage = () => {
       const formData = new FormData();
       formData.append("query", message);
       formData.append("uid", currentUser.uid);
-      const response = await fetch(`${API_BASE_URL}/query`, {
+      // Tokens are shown as they arrive; the full answer is saved once the stream is done
+      const response = await fetch(`${API_BASE_URL}/query/stream`, {
         method: "POST",
         body: formData,
       });
@@ -344,11 +386,22 @@ const MainPage = () => {
           errorData.detail || `Query failed with status: ${response.status}`
         );
       }
-      const data = await response.json();
+      let answer = "";
+      let error = null;
+      await readEventStream(response, (event) => {
+        if (event.token) {
+          answer += event.token;
+          setStreamingText(answer);
+        } else if (event.error) {
+          error = event.error;
+        } else if (event.done) {
+          answer = event.response;
+        }
+      });
 
       const modelMessage = {
         type: "model",
-        text: data.error ? `Error: ${data.error}` : data.response,
+        text: error ? `Error: ${error}` : answer,
         timestamp: new Date().toISOString(),
       };
       await addDoc(
@@ -367,6 +420,7 @@ const MainPage = () => {
       setApiError(true); // Show API error message
     } finally {
       setIsLoading(false);
+      setStreamingText("");
     }
   };
 
@@ -488,7 +542,21 @@ const MainPage = () => {
                         )}
                       </div>
                     ))}
-                    {isLoading && (
+                    {isLoading && streamingText && (
+                      <div
+                        style={{
+                          ...styles.messageModel,
+                          animation: "slideUp 0.3s ease-out",
+                        }}
+                      >
+                        <div style={styles.markdownChunk}>
+                          <ReactMarkdown rehypePlugins={[rehypeSanitize]}>
+                            {streamingText}
+                          </ReactMarkdown>
+                        </div>
+                      </div>
+                    )}
+                    {isLoading && !streamingText && (
                       <div
                         style={{
                           ...styles.loading,